@@ -0,0 +1,247 @@
+"""提取性能基准：生成可复现的合成日志语料，测量读取、各提取模式（含数值模板）及导出的吞吐量
+
+    python benchmark.py --files 20 --size-mb 5 --encoding gbk --ext dat,xlsx -o bench.jsonl
+
+每个测试在单独的子进程中运行，峰值内存只包含该测试本身；结果每行一个 JSON 对象追加到输出文件，
+便于不同版本之间对比。语料由 --seed 决定，参数相同时生成的文件完全相同。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from openpyxl import Workbook
+
+from extract_core import (DEFAULT_BUFFER_SIZE, DEFAULT_PAIRING, TEMPLATE_MODE, ResultStore, detect_file_encoding,
+                          export_results, extract_file, iter_byte_chunks, open_workbook, iter_excel_chunks)
+
+# 合成语料中的关键词，每个关键词行同时满足四种提取模式
+KEYWORD1 = "Angle"
+KEYWORD2 = "Power"
+# 模板模式（-m 6）测试的模板，每条记录取关键词行中的全部 4 个数值
+TEMPLATE = f"{KEYWORD1} {{n}} {{n}} {{n}} ... {KEYWORD2} {{n}}"
+# 每种行预先生成的样本数，生成文件时从中随机抽取
+LINE_POOL = 4096
+# 提取模式名称，用于输出
+MODES = {1: "单值", 2: "双值", 3: "双关键词值", 4: "三值", TEMPLATE_MODE: "模板"}
+FILLER_WORDS = ["温度传感器", "读数正常", "采样完成", "通道", "状态", "校准", "设备", "记录", "system", "ok", "info",
+                "debug", "frame", "sync"]
+
+
+def make_lines(rng, density, noise):
+    """生成三类行的样本：关键词行、带数字及相近关键词的干扰行、普通填充行，返回 (样本列表, 抽样概率)"""
+    values = rng.normal(0, 100, (LINE_POOL, 4))
+    keyword_lines = [f"{KEYWORD1} {a:.4f} {b:.4f} {c:.4f} {KEYWORD2} {p:.3f}\n" for a, b, c, p in values]
+    noise_lines = [f"{rng.choice(FILLER_WORDS)} angle={v:.3f} Angl {w:.2f} {KEYWORD1.lower()} {int(v * 7)}\n"
+                   for v, w in rng.normal(0, 50, (LINE_POOL, 2))]
+    filler_lines = [" ".join(rng.choice(FILLER_WORDS, size=int(rng.integers(3, 9)))) + "\n" for _ in range(LINE_POOL)]
+    weights = np.array([density, (1 - density) * noise, (1 - density) * (1 - noise)])
+    return [keyword_lines, noise_lines, filler_lines], weights
+
+
+def generate_text(rng, size, density, noise):
+    """生成约 size 个字符的日志文本"""
+    pools, weights = make_lines(rng, density, noise)
+    average = sum(w * np.mean([len(line) for line in pool]) for pool, w in zip(pools, weights))
+    count = max(1, int(size / average))
+    kinds = rng.choice(3, size=count, p=weights)
+    picks = rng.integers(0, LINE_POOL, size=count)
+    return "".join(pools[kind][pick] for kind, pick in zip(kinds.tolist(), picks.tolist()))
+
+
+def generate_corpus(directory, files=10, size=1024 * 1024, density=0.3, noise=0.5, encoding='utf-8',
+                    exts=('dat',), seed=0):
+    """在 directory 中生成合成语料，每种扩展名 files 个文件，每个约 size 字节，返回文件路径列表
+
+    density 为关键词行占比，noise 为其余行中带数字和相近关键词的干扰行占比；xlsx 每行拆为单元格写入。
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for ext in exts:
+        rng = np.random.default_rng([seed, sum(map(ord, ext))])
+        for n in range(files):
+            text = generate_text(rng, size, density, noise)
+            file_path = os.path.join(directory, f"{n + 1}.{ext}")
+            if ext == 'xlsx':
+                workbook = Workbook(write_only=True)
+                sheet = workbook.create_sheet("Sheet1")
+                for line in text.splitlines():
+                    sheet.append(line.split(" "))
+                workbook.save(file_path)
+            else:
+                with open(file_path, 'w', encoding=encoding, newline='\n') as f:
+                    f.write(text)
+            paths.append(file_path)
+    return paths
+
+
+def peak_rss_mb():
+    """当前进程的峰值内存（MB），无法获取时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_read(file_paths, buffer_size):
+    """只读取文件内容、不匹配（文本文件检测编码后按字节块读取，xlsx 逐单元格展开为文本）"""
+    for file_path in file_paths:
+        if file_path.endswith('.xlsx'):
+            workbook = open_workbook(file_path)
+            try:
+                for worksheet in workbook.worksheets:
+                    for _ in iter_excel_chunks(worksheet, buffer_size):
+                        pass
+            finally:
+                workbook.close()
+        else:
+            detect_file_encoding(file_path)
+            for _ in iter_byte_chunks(file_path, buffer_size):
+                pass
+
+
+def run_extract(file_paths, mode, buffer_size, pairing=DEFAULT_PAIRING):
+    """按指定模式及配对规则提取全部文件，返回匹配的记录数"""
+    queries = [(mode, TEMPLATE, "")] if mode == TEMPLATE_MODE else [(mode, KEYWORD1, KEYWORD2)]
+    return sum(len(extract_file(file_path, queries, buffer_size, pairing=pairing)[0]) for file_path in file_paths)
+
+
+def run_export(file_paths, buffer_size, output):
+    """先提取单值结果（不计时），再计时导出到 output，返回导出的行数"""
+    queries = [(1, KEYWORD1, "")]
+    store = ResultStore(queries)
+    for file_path in file_paths:
+        store.add(file_path, extract_file(file_path, queries, buffer_size))
+    start = time.perf_counter()
+    export_results(output, 1, store, queries)
+    return len(store.values(0)), time.perf_counter() - start
+
+
+def run_case(case, file_paths, buffer_size, workdir):
+    """在子进程中运行一个测试，返回 (耗时秒数, 匹配数, 峰值内存 MB)，读取测试的匹配数为 None"""
+    if case['benchmark'] == 'export':
+        output = os.path.join(workdir, f"export.{case['format']}")
+        matches, seconds = run_export(file_paths, buffer_size, output)
+        for name in os.listdir(workdir):
+            if name.startswith('export'):
+                os.remove(os.path.join(workdir, name))
+        return seconds, matches, peak_rss_mb()
+
+    start = time.perf_counter()
+    if case['benchmark'] == 'read':
+        run_read(file_paths, buffer_size)
+        matches = None
+    else:
+        matches = run_extract(file_paths, case['mode'], buffer_size, case.get('pairing', DEFAULT_PAIRING))
+    return time.perf_counter() - start, matches, peak_rss_mb()
+
+
+def git_commit():
+    """当前代码的 git 提交号，不在仓库中时返回 None"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="提取性能基准：生成合成语料并测量读取、提取与导出的吞吐量")
+    parser.add_argument("--files", type=int, default=10, help="每种文件类型的文件个数")
+    parser.add_argument("--size-mb", type=float, default=2, help="每个文件的大小(MB)")
+    parser.add_argument("--density", type=float, default=0.3, help="关键词行占比 (0~1)")
+    parser.add_argument("--noise", type=float, default=0.5, help="非关键词行中带数字和相近关键词的干扰行占比 (0~1)")
+    parser.add_argument("--encoding", default="utf-8", choices=("utf-8", "gbk"), help="文本文件编码")
+    parser.add_argument("--ext", default="dat,log", help="生成的文件类型，逗号分隔：dat、log、txt、xlsx")
+    parser.add_argument("--modes", default="1,2,3,4,6", help=f"测试的提取模式，逗号分隔，6 为模板 \"{TEMPLATE}\"")
+    parser.add_argument("--pairing", default=DEFAULT_PAIRING, help="模板中间隔（双值、三值、双关键词值等）的配对规则，如 line、tokens:4")
+    parser.add_argument("--export", default="xlsx", help="测试的导出格式，逗号分隔，留空不测试导出")
+    parser.add_argument("--repeat", type=int, default=3, help="每个测试重复次数，取最短耗时")
+    parser.add_argument("--seed", type=int, default=0, help="语料随机种子")
+    parser.add_argument("--buffer-mb", type=int, default=DEFAULT_BUFFER_SIZE // (1024 * 1024), help="读取缓冲区(MB)")
+    parser.add_argument("--corpus", default="", help="语料目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("-o", "--output", default="", help="结果文件（JSON Lines，追加写入），默认只输出到标准输出")
+    args = parser.parse_args(argv)
+
+    exts = [e.strip().lower().lstrip('.') for e in args.ext.split(',') if e.strip()]
+    modes = [int(m) for m in args.modes.split(',') if m.strip()]
+    formats = [f.strip().lower().lstrip('.') for f in args.export.split(',') if f.strip()]
+    buffer_size = max(1, args.buffer_mb) * 1024 * 1024
+    workdir = args.corpus or tempfile.mkdtemp(prefix="extract_bench_")
+    params = {k: v for k, v in vars(args).items() if k not in ('output', 'corpus')}
+
+    try:
+        start = time.perf_counter()
+        paths = generate_corpus(workdir, args.files, int(args.size_mb * 1024 * 1024), args.density, args.noise,
+                                args.encoding, exts, args.seed)
+        print(f"生成语料 {len(paths)} 个文件，耗时 {time.perf_counter() - start:.1f} 秒", file=sys.stderr)
+
+        cases = []
+        for ext in exts:
+            cases.append({'benchmark': 'read', 'ext': ext})
+            cases.extend({'benchmark': 'extract', 'ext': ext, 'mode': mode, 'pairing': args.pairing} for mode in modes)
+        cases.extend({'benchmark': 'export', 'ext': exts[0], 'format': fmt} for fmt in formats)
+
+        meta = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': params,
+        }
+        output = open(args.output, 'a', encoding='utf-8') if args.output else None
+        spawn = multiprocessing.get_context('spawn')
+        try:
+            for case in cases:
+                file_paths = [p for p in paths if p.endswith('.' + case['ext'])]
+                size = sum(os.path.getsize(p) for p in file_paths)
+                runs = []
+                for _ in range(max(1, args.repeat)):
+                    # 每次在新进程中运行，峰值内存不受之前测试的影响
+                    with ProcessPoolExecutor(1, mp_context=spawn) as pool:
+                        runs.append(pool.submit(run_case, case, file_paths, buffer_size, workdir).result())
+                seconds, matches, peak = min(runs, key=lambda run: run[0])
+                record = dict(case, files=len(file_paths), bytes=size, seconds=round(seconds, 4),
+                              seconds_all=[round(run[0], 4) for run in runs],
+                              mb_per_s=round(size / (1024 * 1024) / seconds, 2) if seconds else None,
+                              matches=matches,
+                              matches_per_s=round(matches / seconds, 1) if seconds and matches is not None else None,
+                              peak_rss_mb=round(max(run[2] for run in runs), 1) if peak is not None else None,
+                              **meta)
+                line = json.dumps(record, ensure_ascii=False)
+                print(line)
+                if output:
+                    output.write(line + "\n")
+                    output.flush()
+                label = case['benchmark'] + (f" 模式{case['mode']}({MODES[case['mode']]})" if 'mode' in case else "")
+                label += f" {case.get('format', case['ext'])}"
+                print(f"{label:<28} {record['mb_per_s']} MB/s  {record['matches_per_s'] or '-'} 条/s  "
+                      f"峰值内存 {record['peak_rss_mb']} MB", file=sys.stderr)
+        finally:
+            if output:
+                output.close()
+    finally:
+        if not args.corpus:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2641 @@
+"""日志文件数值提取核心，不依赖 Tk，可在无界面的服务器上导入或通过命令行运行
+
+    python extract_core.py 数据目录 "logs/*.log" -k Angle -m 1 -o 结果.xlsx
+"""
+import argparse
+import codecs
+import contextlib
+import cProfile
+import csv
+import functools
+import glob
+import heapq
+import io
+import itertools
+import json
+import os
+import pstats
+import re
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+# 数值匹配模式：整数、小数及科学计数法
+NUMBER_PATTERN = r'-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?'
+# 流式读取的默认缓冲区大小（字节）
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+# 没有换行符的超长行中，末尾保留多少字符以免截断数值
+TAIL_GUARD = 64
+# 跨块保留文本的最小长度，保证缓冲区设置很小时也能匹配完整的一条记录
+MIN_CARRY = 64 * 1024
+# 并行提取时每个进程任务最多包含的文件数
+PARALLEL_BATCH_MAX = 64
+# 结果缓存格式版本，提取规则变化时递增以使旧缓存失效
+CACHE_VERSION = 6
+# 进程内缓存的已编译查询集合个数，相同的查询和配对规则在一次运行中只编译一次
+QUERY_SET_CACHE_SIZE = 32
+# 结果缓存的默认容量上限（字节），超出后淘汰最久未使用的条目
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# 判断文件编码时读取的样本大小（字节）
+ENCODING_SAMPLE_SIZE = 64 * 1024
+# 与 ASCII 兼容的编码：数字、空白和换行都是单字节，可以直接在原始字节上匹配
+BYTE_ENCODINGS = ('utf-8', 'utf-8-sig', 'gbk', 'latin-1')
+# 按列提取时作为表格读取的文件类型
+TABLE_EXTS = ('xlsx', 'csv')
+# 按列提取时每次读取的行数
+TABLE_CHUNK_ROWS = 100000
+# Excel 单个工作表的最大行数（含表头），超过后续写到新的工作表
+EXCEL_MAX_ROWS = 1048576
+# 导出时每写入多少行报告一次进度
+EXPORT_PROGRESS_ROWS = 65536
+# 导出 CSV/Parquet/Feather 时每次写入的行数
+TABLE_EXPORT_ROWS = 1000000
+# 导出文件扩展名对应的格式
+EXPORT_FORMATS = {'.xlsx': 'xlsx', '.csv': 'csv', '.parquet': 'parquet', '.feather': 'feather', '.arrow': 'feather'}
+# 导出 Parquet/Feather 时作为文本或整数保存的列，其余列保存为浮点数
+TEXT_COLUMNS = ('角度', '文件名', '关键词')
+INTEGER_COLUMNS = ('个数', '序号', '值的个数', '值的组数', '匹配行数', '值序号')
+# 数据处理统计中附加的百分位数
+STAT_PERCENTILES = (5, 50, 95)
+# 分组求百分位数时平均每组不少于该记录数则逐组原地排序，否则（组很多且很小，逐组排序的 Python 开销占主导）整体排序一次
+GROUP_SORT_MIN_SIZE = 4
+# 流式统计中分位数草图最高一层的容量：不超过该个数的数值全部保留、分位数精确，更多时名次误差约为总数的 0.5%
+SKETCH_CAPACITY = 512
+# 分位数草图暂存多少个数值后合并计数
+SKETCH_FLUSH = 65536
+# 图表用的定宽直方图桶数：每列的一维直方图及前两列的二维密度图（每一维），须为偶数
+CHART_HIST_BINS = 1024
+CHART_DENSITY_BINS = 256
+# 性能报告中列出的最慢文件个数
+PERF_SLOWEST = 20
+# cProfile 和 tracemalloc 报告中保留的条目数
+PERF_PROFILE_LINES = 30
+# 性能记录的阶段及显示名称，按处理顺序排列
+PERF_STAGES = {
+    'detect': '编码检测',
+    'read': '磁盘读取',
+    'decode': '解码/表格解析',
+    'scan': '正则匹配',
+    'parse': '数值转换',
+    'cache': '缓存读写',
+    'store': '保存结果',
+    'insert': '结果列表插入',
+    'chart': '图表绘制',
+    'export': '导出',
+}
+# 关键词1与其后数值（双值、三值）或关键词2（双关键词值）的配对规则：next 之后最近的数值或关键词2，line 同一行，
+# lines:N 之后 N 行以内，bytes:N 之后 N 字节以内（解码后的文本按字符），block 同一记录块（以空行分隔），
+# tokens:N 之后 N 个词（空白分隔）以内
+PAIRING_RULES = {'next': '最近的', 'line': '同一行', 'lines': 'N 行以内', 'bytes': 'N 字节以内', 'block': '同一记录块',
+                 'tokens': 'N 个词以内'}
+DEFAULT_PAIRING = 'next'
+# 模板提取的查询模式编号，关键词1为模板文本，如 "Angle {n} ... Power {n} {n} {n}"
+TEMPLATE_MODE = 6
+# 模板中的数值占位符和间隔（之后最近的下一段，范围由配对规则限制）
+TEMPLATE_NUMBER = '{n}'
+TEMPLATE_GAP = '...'
+# 各提取模式的模板对应的简写（多关键词列表中的写法），{0}、{1} 为模板中的关键词，用作查询的显示名称
+TEMPLATE_SHORTHANDS = {
+    ('text', 'number'): '{0}',
+    ('text', 'number', 'gap', 'number'): '{0}*2',
+    ('text', 'number', 'gap', 'text', 'number'): '{0}&{1}',
+    ('text', 'number', 'gap', 'number', 'gap', 'number'): '{0}*3',
+}
+
+
+def query_columns(query):
+    """查询每条记录包含的数值个数"""
+    return query_template(query).columns
+
+
+def parse_numbers(strings):
+    """将数值字符串（str 或 bytes）一次性转换为 float64 数组，无法解析的记为 NaN"""
+    if not strings:
+        return np.empty(0, dtype=np.float64)
+    try:
+        return np.array(strings).astype(np.float64)
+    except ValueError:
+        values = np.full(len(strings), np.nan)
+        for i, text in enumerate(strings):
+            try:
+                values[i] = float(text)
+            except ValueError:
+                continue
+        return values
+
+
+def collect_values(matches, columns, groups=None):
+    """将匹配结果一次性转换为 float64 数组：每条记录 1 个值时形状为 (N,)，否则为 (N, columns)
+
+    groups 为数值所在的分组序号，默认为全部分组。
+    """
+    if groups is None:
+        strings = [g for match in matches for g in match.groups()]
+    elif len(groups) == 1:
+        strings = [match.group(groups[0]) for match in matches]
+    else:
+        strings = [g for match in matches for g in match.group(*groups)]
+    values = parse_numbers(strings)
+    if columns == 1:
+        return values
+    return values.reshape(-1, columns)
+
+
+def detect_encoding(sample):
+    """根据 BOM 和样本内容判断编码：先检查 BOM，再依次尝试严格解码 UTF-8 和 GBK"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    for encoding in ('utf-8', 'gbk'):
+        try:
+            sample.decode(encoding)
+            return encoding
+        except UnicodeDecodeError as e:
+            # 样本末尾可能截断了一个多字节字符
+            if len(sample) >= ENCODING_SAMPLE_SIZE and e.start >= len(sample) - 3:
+                return encoding
+    return 'latin-1'
+
+
+def detect_file_encoding(file_path):
+    with open(file_path, 'rb') as f:
+        return detect_encoding(f.read(ENCODING_SAMPLE_SIZE))
+
+
+def iter_byte_chunks(file_path, buffer_size=DEFAULT_BUFFER_SIZE):
+    """按固定大小分块读取原始字节，返回 (字节块, 是否最后一块)"""
+    with open(file_path, 'rb') as f:
+        while True:
+            raw = f.read(buffer_size)
+            if not raw:
+                yield b'', True
+                return
+            yield raw, False
+
+
+def decode_chunks(chunks, encoding):
+    """逐块增量解码 (字节块, 是否最后一块)，返回 (文本块, 是否最后一块)"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+    for raw, final in chunks:
+        yield decoder.decode(raw, final=final), final
+
+
+def iter_text_chunks(file_path, buffer_size=DEFAULT_BUFFER_SIZE, encoding='utf-8'):
+    """按固定大小分块读取文本文件，返回 (文本块, 是否最后一块)"""
+    return decode_chunks(iter_byte_chunks(file_path, buffer_size), encoding)
+
+
+class StageTimer:
+    """按阶段累计单个文件的耗时和数据量，stages 为 {阶段: [秒数, 字节数]}
+
+    阶段可以嵌套（如匹配过程中读取下一块），嵌套阶段的耗时只计入最内层，各阶段之和等于总耗时。
+    解码后的文本按字符数计入数据量。
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._stack = []
+
+    def start(self, stage):
+        self._stack.append([stage, time.perf_counter(), 0.0])
+
+    def stop(self, nbytes=0):
+        stage, start, inner = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        if self._stack:
+            self._stack[-1][2] += elapsed
+        entry = self.stages.setdefault(stage, [0.0, 0])
+        entry[0] += elapsed - inner
+        entry[1] += nbytes
+
+    def timed(self, chunks, stage):
+        """包装迭代器，取下一项的耗时计入 stage；(数据块, 是否最后一块) 的块长度计入数据量"""
+        chunks = iter(chunks)
+        while True:
+            self.start(stage)
+            item = next(chunks, None)
+            self.stop(len(item[0]) if isinstance(item, tuple) else 0)
+            if item is None:
+                return
+            yield item
+
+
+class _NullTimer:
+    """性能记录关闭时使用的 StageTimer，不计时也不保存任何内容"""
+    stages = None
+
+    def start(self, stage):
+        pass
+
+    def stop(self, nbytes=0):
+        pass
+
+    def timed(self, chunks, stage):
+        return chunks
+
+
+NULL_TIMER = _NullTimer()
+
+
+def parse_query_list(text):
+    """解析多关键词列表，条目以分号或换行分隔
+
+    关键词        单值
+    关键词*2      双值
+    关键词*3      三值
+    关键词1&关键词2  双关键词值
+    含 {n} 的条目   数值模板（见 ValueTemplate），如 Angle {n} ... Power {n} {n}
+    返回 [(模式, 关键词1, 关键词2), ...]，模式编号与界面上的提取模式一致，模板格式错误时抛出 ValueError
+    """
+    queries = []
+    for item in re.split(r'[;；\n]', text):
+        item = item.strip()
+        if not item:
+            continue
+        if TEMPLATE_NUMBER in item:
+            queries.append((TEMPLATE_MODE, ValueTemplate.parse(item).text, ""))
+        elif '&' in item:
+            keyword1, keyword2 = (k.strip() for k in item.split('&', 1))
+            if keyword1 and keyword2:
+                queries.append((3, keyword1, keyword2))
+        elif item.endswith('*2'):
+            queries.append((2, item[:-2].strip(), ""))
+        elif item.endswith('*3'):
+            queries.append((4, item[:-2].strip(), ""))
+        else:
+            queries.append((1, item, ""))
+    return [q for q in queries if q[1]]
+
+
+def query_label(query):
+    """查询的显示名称，见 ValueTemplate.label"""
+    return query_template(query).label
+
+
+def parse_pairing(rule):
+    """解析配对规则（如 next、line、lines:3、bytes:200、block、tokens:4），返回 (规则, N)，格式错误时抛出 ValueError"""
+    kind, _, limit = rule.strip().lower().partition(':')
+    if kind not in PAIRING_RULES:
+        raise ValueError(f"未知的配对规则: {rule}")
+    if kind in ('lines', 'bytes', 'tokens'):
+        if not limit.isdigit():
+            raise ValueError(f"配对规则 {kind} 需要非负整数 N，如 {kind}:10")
+        return kind, int(limit)
+    if limit:
+        raise ValueError(f"配对规则 {kind} 不需要参数: {rule}")
+    return kind, 0
+
+
+class _PairMatch:
+    """逐段匹配的结果，提供与 re.Match 相同的 start、end、groups
+
+    group(*分组) 返回全部数值（只有一个值时返回该值），与快速正则按数值分组取值的结果一致，见 TemplateMatcher.groups。
+    """
+    __slots__ = ('_start', '_end', '_groups')
+
+    def __init__(self, start, end, groups):
+        self._start = start
+        self._end = end
+        self._groups = groups
+
+    def start(self):
+        return self._start
+
+    def end(self):
+        return self._end
+
+    def groups(self):
+        return self._groups
+
+    def group(self, *indexes):
+        return self._groups if len(indexes) > 1 else self._groups[0]
+
+
+class ValueTemplate:
+    """数值提取模板：关键词、数值 {n} 和间隔 ... 组成的序列，各提取模式都编译为模板
+
+    "Angle {n} ... Power {n} {n} {n}" 表示 Angle 后的一个数值、之后最近的 Power 及其后的三个数值，每条记录 4 个值。
+    关键词与数值之间可以有任意空白，相邻的数值之间至少隔一个空白；间隔之后是数值时与前一段至少隔一个字符
+    （与原双值、三值正则相同），之后是关键词时可以紧接。模板须以关键词开头，用于在文本中定位。
+    parts 为 ('text', 关键词)、('number', None)、('gap', None) 的序列，格式错误时抛出 ValueError。
+    """
+
+    def __init__(self, parts, text=None):
+        self.parts = tuple(parts)
+        kinds = [kind for kind, _ in self.parts]
+        if not kinds or kinds[0] != 'text':
+            raise ValueError("模板须以关键词开头")
+        if 'number' not in kinds:
+            raise ValueError(f"模板中没有数值占位符 {TEMPLATE_NUMBER}")
+        if kinds[-1] == 'gap' or any(a == b != 'number' for a, b in zip(kinds, kinds[1:])):
+            raise ValueError(f"模板中的 {TEMPLATE_GAP} 须位于两段之间，且关键词或间隔不能连续出现")
+        self.anchor = self.parts[0][1]
+        self.text = text if text is not None else self.format()
+        # 显示名称：由模板文本解析的为模板文本，各提取模式的模板为其简写（如 Angle*2、Angle&Power）
+        shorthand = TEMPLATE_SHORTHANDS.get(tuple(kinds), self.text)
+        self.label = text if text is not None else shorthand.format(*(v for k, v in self.parts if k == 'text'))
+        # 以间隔分段，units[0] 在关键词位置匹配，之后每段在前一段之后查找
+        self.units = [[]]
+        for part in self.parts:
+            if part[0] == 'gap':
+                self.units.append([])
+            else:
+                self.units[-1].append(part)
+        self.gaps = len(self.units) - 1
+        # 每个数值所属的关键词（其前最近的关键词）及显示名称
+        self.keys = []
+        keyword = self.anchor
+        for kind, value in self.parts:
+            if kind == 'text':
+                keyword = value
+            elif kind == 'number':
+                self.keys.append(keyword)
+        self.columns = len(self.keys)
+        self.labels = [f"{key}值" if self.keys.count(key) == 1 else f"{key}值{self.keys[:j + 1].count(key)}"
+                       for j, key in enumerate(self.keys)]
+        # 两个值分别跟在不同关键词之后（双关键词值），图表中作为一对关联值
+        self.paired = self.columns == 2 and self.keys[0] != self.keys[1]
+        self.matchers = {}
+
+    @classmethod
+    def parse(cls, text):
+        """解析模板文本，如 "Angle {n} ... Power {n} {n} {n}"，关键词两端的空白被忽略"""
+        parts = []
+        for token in re.split(r'(\{n\}|\.\.\.)', text):
+            if token == TEMPLATE_NUMBER:
+                parts.append(('number', None))
+            elif token == TEMPLATE_GAP:
+                parts.append(('gap', None))
+            elif token.strip():
+                parts.append(('text', token.strip()))
+        return cls(parts, text.strip())
+
+    def format(self):
+        """模板文本"""
+        return " ".join(TEMPLATE_NUMBER if kind == 'number' else TEMPLATE_GAP if kind == 'gap' else value
+                        for kind, value in self.parts)
+
+    def matcher(self, encoding=None, pairing=DEFAULT_PAIRING):
+        """在指定编码（None 为 str）上按配对规则匹配的 TemplateMatcher，每种组合只编译一次"""
+        key = (encoding, pairing if self.gaps else DEFAULT_PAIRING)
+        if key not in self.matchers:
+            self.matchers[key] = TemplateMatcher(self, *key)
+        return self.matchers[key]
+
+    def table_columns(self, columns):
+        """按列提取时每个数值所在的列序号：关键词为表头名称，其后的数值依次取该列及之后的列，找不到时返回 None"""
+        positions = []
+        column = None
+        for kind, value in self.parts:
+            if kind == 'text':
+                column = match_column(columns, value)
+                if column is None:
+                    return None
+            elif kind == 'number':
+                if column >= len(columns):
+                    return None
+                positions.append(column)
+                column += 1
+        return positions
+
+
+@functools.lru_cache(maxsize=QUERY_SET_CACHE_SIZE * 8)
+def query_template(query):
+    """查询 (模式, 关键词1, 关键词2) 对应的模板，模板模式的格式错误抛出 ValueError
+
+    单值为 "关键词1 {n}"，双值为 "关键词1 {n} ... {n}"，双关键词值为 "关键词1 {n} ... 关键词2 {n}"，
+    三值为 "关键词1 {n} ... {n} ... {n}"，模板模式解析关键词1中的模板文本。
+    """
+    mode, keyword1, keyword2 = query
+    if mode == TEMPLATE_MODE:
+        return ValueTemplate.parse(keyword1)
+    number, gap = ('number', None), ('gap', None)
+    parts = {1: [number], 2: [number, gap, number], 3: [number, gap, ('text', keyword2), number],
+             4: [number, gap, number, gap, number]}[mode]
+    return ValueTemplate([('text', keyword1)] + parts)
+
+
+class _TemplateScan:
+    """TemplateMatcher 在一段文本上的查找状态，match 须按位置递增调用
+
+    每段记住上一次查找的起点和结果：同一起点之后、上次结果之前没有该段的匹配，之后的查找直接复用，
+    各段查找过的范围互不重叠，总耗时与文本长度成线性关系；配对范围的分隔位置只查找一次。
+    """
+
+    def __init__(self, matcher, text):
+        self.matcher = matcher
+        self.text = text
+        self.fast = matcher.fast
+        self.found = [None] * len(matcher.units)
+        self.breaks = None
+        self.k = 0
+        self.last = 0
+
+    def _limit(self, end):
+        """第一段结束位置 end 之后配对范围的终点，之后各段须在终点之前开始"""
+        kind, limit = self.matcher.kind, self.matcher.limit
+        if kind == 'next':
+            return len(self.text) + 1
+        if kind == 'bytes':
+            return end + limit + 1
+        if self.breaks is None:
+            self.breaks = [m.end() for m in self.matcher.boundary.finditer(self.text)]
+        breaks = self.breaks
+        k = self.k
+        while k < len(breaks) and breaks[k] <= end:
+            k += 1
+        self.k = k
+        # 范围内最多跨过 limit 个分隔（换行、空行或词的开头）
+        k += limit
+        return breaks[k] if k < len(breaks) else len(self.text) + 1
+
+    def _find(self, j, start):
+        """第 j 段在 start 或之后的第一个匹配"""
+        memo = self.found[j]
+        if memo is not None:
+            origin, found = memo
+            if origin <= start and (found is None or found.start() >= start):
+                return found
+        found = self.matcher.units[j].search(self.text, start)
+        self.found[j] = (start, found)
+        return found
+
+    def match(self, text, pos):
+        units = self.matcher.units
+        if self.fast is not None:
+            found = self.fast.match(text, pos)
+            if found is not None or units[0].match(text, pos) is None:
+                return found
+            # 第一段匹配而之后某一段找不到时正则可能已扫描到文本末尾，此后改为逐段查找，避免重复扫描
+            self.fast = None
+            return None
+
+        first = units[0].match(text, pos)
+        if first is None:
+            return None
+        end = first.end()
+        if end < self.last:
+            # 只有关键词由空白或数字组成时才会出现，从头查找分隔位置以保证结果正确
+            self.k = 0
+        self.last = end
+        limit = self._limit(end)
+        values = first.groups()
+        for j in range(1, len(units)):
+            found = self._find(j, end + self.matcher.min_gaps[j])
+            if found is None or found.start() >= limit:
+                return None
+            values += found.groups()
+            end = found.end()
+        return _PairMatch(pos, end, values)
+
+
+class TemplateMatcher:
+    """ValueTemplate 在指定编码和配对规则下编译的匹配器，与正则对象一样提供 match(text, pos)，用法见 QuerySet.scan
+
+    每个数值写作 (?=(数值))\\1：先行断言成功后不再回溯，数值不会被拆开（原正则在之后数值不足时会把 "Angle 1234"
+    拆成 12 和 4）。没有间隔的模板编译为一个正则。有间隔时每段单独编译：第一段在关键词位置匹配，之后各段从前一段
+    结束处查找最近的匹配，间隔的范围从第一段结束处起按配对规则计算：next 不限范围，line 同一行，
+    lines:N、bytes:N、tokens:N 之后 N 行、N 字节、N 个词以内，block 同一记录块。
+    next 规则先用把各段连成的一个正则（每个 "间隔 下一段" 同样放在先行断言中）匹配，只在某段找不到时改为逐段查找。
+    """
+
+    def __init__(self, template, encoding=None, pairing=DEFAULT_PAIRING):
+        self.template = template
+        self.encoding = encoding
+        self.kind, self.limit = parse_pairing(pairing)
+        boundary = {'line': r'\n', 'lines': r'\n', 'block': r'\n(?=[ \t\r]*\n)', 'tokens': r'\s(?=\S)'}.get(self.kind)
+        self.boundary = None if boundary is None else re.compile(self._source([('re', boundary)]))
+        # 间隔之后是数值时与前一段至少隔一个字符
+        self.min_gaps = [0] + [1 if unit[0][0] == 'number' else 0 for unit in template.units[1:]]
+        self.units = [re.compile(self._source(self._unit(unit, [0]))) for unit in template.units]
+        self.fast = None
+        # 快速正则中数值所在的分组序号，None 表示全部分组都是数值
+        self.groups = None
+        if len(self.units) == 1:
+            self.fast = self.units[0]
+        elif self.kind == 'next':
+            counter = [0]
+            wrappers = []
+            pieces = self._unit(template.units[0], counter, last=False)
+            for unit, gap in zip(template.units[1:], self.min_gaps[1:]):
+                counter[0] += 1
+                wrappers.append(counter[0])
+                pieces.append(('re', r'(?=([\s\S]' + ('+?' if gap else '*?')))
+                pieces += self._unit(unit, counter)
+                pieces.append(('re', r'))\%d' % wrappers[-1]))
+            self.fast = re.compile(self._source(pieces))
+            # 数值各占一个分组，包住 "间隔 下一段" 的分组不是数值
+            self.groups = tuple(n for n in range(1, counter[0] + 1) if n not in wrappers)
+
+    @staticmethod
+    def _unit(unit, counter, last=True):
+        """一段的表达式片段：('re', 正则) 或 ('text', 关键词)，counter[0] 为已用的分组数
+
+        数值写作先行断言加反向引用，不会回溯；last 为 True 时段末的数值之后没有其他内容，直接写为分组。
+        """
+        pieces = []
+        for n, (kind, value) in enumerate(unit):
+            if n:
+                both = kind == 'number' and unit[n - 1][0] == 'number'
+                pieces.append(('re', r'\s+' if both else r'\s*'))
+            if kind == 'text':
+                pieces.append(('text', value))
+                continue
+            counter[0] += 1
+            if last and n == len(unit) - 1:
+                pieces.append(('re', f'({NUMBER_PATTERN})'))
+            else:
+                pieces.append(('re', f'(?=({NUMBER_PATTERN}))\\{counter[0]}'))
+        return pieces
+
+    def _source(self, pieces):
+        """拼接表达式片段，指定编码时关键词按该编码转换为字节"""
+        if self.encoding is None:
+            return "".join(value if kind == 're' else re.escape(value) for kind, value in pieces)
+        return b"".join(value.encode('ascii') if kind == 're' else re.escape(value.encode(self.encoding))
+                        for kind, value in pieces)
+
+    def bind(self, text):
+        """在 text 上查找的对象，其 match(text, pos) 须按位置递增调用；没有间隔的模板直接返回正则"""
+        if len(self.units) == 1:
+            return self.fast
+        return _TemplateScan(self, text)
+
+
+class QuerySet:
+    """一次扫描同时提取多个关键词
+
+    关键词是普通字面量，直接用 str.find / bytes.find 在关键词的出现位置之间跳转（多个关键词按位置归并），
+    只在这些位置上运行对应查询的数值匹配，结果与对每个查询单独 finditer 一致；没有关键词的文本以原始查找速度跳过。
+    指定 encoding 时所有表达式都在该编码的原始字节上匹配，不需要解码文件。
+    每个查询编译为 ValueTemplate 的 TemplateMatcher，模板中的间隔按 pairing 规则配对。
+    """
+
+    def __init__(self, queries, encoding=None, pairing=DEFAULT_PAIRING):
+        self.queries = list(queries)
+        self.encoding = encoding
+        self.pairing = pairing
+        self.templates = [query_template(tuple(query)) for query in self.queries]
+        self.patterns = [template.matcher(encoding, pairing) for template in self.templates]
+        self.groups = [pattern.groups for pattern in self.patterns]
+        self.anchors = [self._encode(template.anchor) for template in self.templates]
+        self.empty = self._encode("")
+        self.newline = self._encode("\n")
+
+        keywords = sorted(set(self.anchors), key=len, reverse=True)
+        self.keywords = keywords
+        self.max_keyword_len = len(keywords[0]) if keywords else 0
+        self.queries_by_keyword = {k: [] for k in keywords}
+        for idx, anchor in enumerate(self.anchors):
+            self.queries_by_keyword[anchor].append(idx)
+        self.encoded = {}
+
+    def _encode(self, text):
+        return text if self.encoding is None else text.encode(self.encoding)
+
+    def for_encoding(self, encoding):
+        """同一组查询在指定编码字节上匹配的版本，关键词无法用该编码表示时抛出 UnicodeEncodeError"""
+        if encoding == 'utf-8-sig':
+            encoding = 'utf-8'
+        if encoding not in self.encoded:
+            self.encoded[encoding] = QuerySet(self.queries, encoding, self.pairing)
+        return self.encoded[encoding]
+
+    def scan(self, text, allowed):
+        """按位置顺序返回 (查询序号, 匹配)
+
+        allowed[i] 为查询 i 允许开始匹配的最小位置，由调用方在接受匹配后更新，
+        以保持与 finditer 相同的不重叠语义。
+        """
+        patterns = [pattern.bind(text) for pattern in self.patterns]
+        queries_by_keyword = self.queries_by_keyword
+        for pos, keyword in self.locate(text):
+            for idx in queries_by_keyword[keyword]:
+                if pos < allowed[idx]:
+                    continue
+                match = patterns[idx].match(text, pos)
+                if match:
+                    yield idx, match
+
+    def locate(self, text):
+        """按位置顺序返回所有关键词的出现位置 (位置, 关键词)，相互重叠的出现也都返回，同一位置较长的关键词在前"""
+        keywords = self.keywords
+        if len(keywords) == 1:
+            keyword = keywords[0]
+            find = text.find
+            pos = find(keyword)
+            while pos != -1:
+                yield pos, keyword
+                pos = find(keyword, pos + 1)
+            return
+        # 每个关键词各自查找下一次出现，按 (位置, 长度顺序) 归并
+        heap = [(pos, order, keyword) for order, keyword in enumerate(keywords)
+                for pos in (text.find(keyword),) if pos != -1]
+        heapq.heapify(heap)
+        while heap:
+            pos, order, keyword = heap[0]
+            yield pos, keyword
+            pos = text.find(keyword, pos + 1)
+            if pos == -1:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (pos, order, keyword))
+
+    def finditer(self, text):
+        """对完整文本执行所有查询"""
+        allowed = [0] * len(self.queries)
+        for idx, match in self.scan(text, allowed):
+            allowed[idx] = match.end()
+            yield idx, match
+
+    def pending_start(self, text, allowed):
+        """最早的尚未匹配成功的关键词位置，可能在后续文本到达后匹配"""
+        starts = [text.find(anchor, allowed[idx]) for idx, anchor in enumerate(self.anchors)]
+        starts = [s for s in starts if s != -1]
+        if starts:
+            return min(starts)
+        return max(0, len(text) - self.max_keyword_len + 1)
+
+    def collect(self, matches):
+        """将 (查询序号, 匹配) 转换为每个查询的数值列表"""
+        grouped = [[] for _ in self.queries]
+        for idx, match in matches:
+            grouped[idx].append(match)
+        return [collect_values(m, template.columns, groups)
+                for m, template, groups in zip(grouped, self.templates, self.groups)]
+
+
+@functools.lru_cache(maxsize=QUERY_SET_CACHE_SIZE)
+def _cached_query_set(queries, pairing):
+    return QuerySet(queries, pairing=pairing)
+
+
+def get_query_set(queries, pairing=DEFAULT_PAIRING):
+    """返回已编译的 QuerySet，相同的查询和配对规则共用同一个对象（及其按编码构建的版本）
+
+    queries 本身是 QuerySet 时原样返回。QuerySet 在扫描时不保存状态，可以在线程之间共用。
+    """
+    if isinstance(queries, QuerySet):
+        return queries
+    return _cached_query_set(tuple(tuple(query) for query in queries), pairing)
+
+
+class StreamScanner:
+    """可分多次送入文本的扫描器，跨块的匹配通过保留尾部文本拼接到下一块处理
+
+    只接受结束在完整行内的匹配；从最早的未完成匹配（或未配对的关键词）处
+    开始的文本会保留到下一块，保留长度不超过 max_carry，因此内存占用与文件大小无关。
+    """
+
+    def __init__(self, query_set, max_carry=DEFAULT_BUFFER_SIZE):
+        self.query_set = query_set
+        self.max_carry = max_carry
+        self.carry = query_set.empty
+        self.allowed = [0] * len(query_set.queries)
+
+    def feed(self, chunk):
+        """送入一块文本，返回已确定的 (查询序号, 匹配) 列表"""
+        buffer = self.carry + chunk
+        allowed = self.allowed
+
+        # 安全边界：最后一个换行符之后的内容可能是不完整的行
+        safe = buffer.rfind(self.query_set.newline) + 1
+        if safe == 0:
+            safe = max(0, len(buffer) - TAIL_GUARD)
+
+        matches = []
+        rejected = None
+        for idx, match in self.query_set.scan(buffer, allowed):
+            if match.end() >= safe:
+                rejected = match.start()
+                break
+            allowed[idx] = match.end()
+            matches.append((idx, match))
+
+        # 关键词出现但尚未匹配完整（如双关键词模式中关键词2在后面的块中）
+        resume = self.query_set.pending_start(buffer, allowed)
+        if rejected is not None:
+            resume = min(resume, rejected)
+        resume = max(resume, len(buffer) - self.max_carry)
+
+        self.carry = buffer[resume:]
+        self.allowed = [max(0, a - resume) for a in allowed]
+        return matches
+
+    def finish(self, chunk=None):
+        """送入最后一块文本，返回剩余的全部匹配"""
+        buffer = self.carry + (chunk or self.query_set.empty)
+        matches = []
+        for idx, match in self.query_set.scan(buffer, self.allowed):
+            self.allowed[idx] = match.end()
+            matches.append((idx, match))
+        self.carry = self.query_set.empty
+        return matches
+
+
+def scan_chunks(chunks, query_set, max_carry=DEFAULT_BUFFER_SIZE, timer=NULL_TIMER):
+    """在文本块流上逐块匹配，返回 (查询序号, 匹配)"""
+    scanner = StreamScanner(query_set, max_carry)
+    for chunk, final in chunks:
+        timer.start('scan')
+        matches = scanner.finish(chunk) if final else scanner.feed(chunk)
+        timer.stop(len(chunk))
+        yield from matches
+        if final:
+            return
+
+
+def byte_query_set(query_set, encoding):
+    """在原始字节上匹配时使用的查询集合，编码不兼容 ASCII 或关键词无法编码时返回 None"""
+    if encoding not in BYTE_ENCODINGS:
+        return None
+    try:
+        return query_set.for_encoding(encoding)
+    except UnicodeEncodeError:
+        return None
+
+
+def extract_stream(file_path, query_set, buffer_size=DEFAULT_BUFFER_SIZE, timer=NULL_TIMER):
+    """流式提取文本文件中的数值，内存占用由 buffer_size 决定
+
+    与 ASCII 兼容的编码直接在原始字节上匹配，只有 UTF-16 等编码才逐块解码。
+    """
+    timer.start('detect')
+    encoding = detect_file_encoding(file_path)
+    timer.stop()
+    max_carry = max(buffer_size, MIN_CARRY)
+    chunks = timer.timed(iter_byte_chunks(file_path, buffer_size), 'read')
+    byte_set = byte_query_set(query_set, encoding)
+    if byte_set is not None:
+        query_set = byte_set
+    else:
+        chunks = timer.timed(decode_chunks(chunks, encoding), 'decode')
+    timer.start('parse')
+    values = query_set.collect(scan_chunks(chunks, query_set, max_carry, timer))
+    timer.stop()
+    return values
+
+
+def iter_excel_chunks(worksheet, buffer_size=DEFAULT_BUFFER_SIZE):
+    """逐行读取只读工作表，每个非空单元格占一行，按约 buffer_size 个字符返回 (文本块, 是否最后一块)
+
+    关键词所在单元格之后的数值（同一单元格或相邻单元格）都能被匹配到，空单元格被跳过。
+    """
+    cells = []
+    size = 0
+    for row in worksheet.iter_rows(values_only=True):
+        for value in row:
+            if value is None:
+                continue
+            text = str(value)
+            cells.append(text)
+            size += len(text) + 1
+        if size >= buffer_size:
+            yield '\n'.join(cells) + '\n', False
+            cells = []
+            size = 0
+    yield '\n'.join(cells) + '\n' if cells else '', True
+
+
+def open_workbook(file_path):
+    """以只读方式打开xlsx文件，单元格按行流式读取，内存占用与工作簿大小无关"""
+    try:
+        return load_workbook(file_path, read_only=True, data_only=True)
+    except Exception as e:
+        raise ValueError(f"读取Excel文件失败: {str(e)}")
+
+
+def read_excel_text(file_path):
+    """读取Excel文件所有工作表，每个非空单元格占一行拼接为文本"""
+    workbook = open_workbook(file_path)
+    try:
+        return ''.join(chunk for worksheet in workbook.worksheets for chunk, _ in iter_excel_chunks(worksheet))
+    except Exception as e:
+        raise ValueError(f"读取Excel文件失败: {str(e)}")
+    finally:
+        workbook.close()
+
+
+def extract_excel(file_path, query_set, buffer_size=DEFAULT_BUFFER_SIZE, timer=NULL_TIMER):
+    """流式提取xlsx文件所有工作表中的数值，每个工作表单独匹配"""
+    timer.start('read')
+    workbook = open_workbook(file_path)
+    timer.stop(os.path.getsize(file_path))
+    max_carry = max(buffer_size, MIN_CARRY)
+    try:
+        matches = itertools.chain.from_iterable(
+            scan_chunks(timer.timed(iter_excel_chunks(worksheet, buffer_size), 'decode'), query_set, max_carry, timer)
+            for worksheet in workbook.worksheets)
+        timer.start('parse')
+        values = query_set.collect(matches)
+        timer.stop()
+        return values
+    except Exception as e:
+        raise ValueError(f"读取Excel文件失败: {str(e)}")
+    finally:
+        workbook.close()
+
+
+def is_table_file(file_path, tabular):
+    """按列提取时该文件是否作为表格读取"""
+    return tabular and os.path.splitext(file_path)[1].lower().lstrip('.') in TABLE_EXTS
+
+
+def match_column(columns, keyword):
+    """表头等于关键词的列序号，没有时取第一个表头包含关键词的列，找不到返回 None"""
+    names = [str(column).strip() for column in columns]
+    if keyword in names:
+        return names.index(keyword)
+    for i, name in enumerate(names):
+        if keyword in name:
+            return i
+    return None
+
+
+def table_columns(columns, query):
+    """查询中各数值对应的列序号（见 ValueTemplate.table_columns），如双关键词值为两个关键词所在列"""
+    return query_template(query).table_columns(columns)
+
+
+def table_values(frame, positions):
+    """取出指定列整体转换为 float64，丢弃含非数值单元格的行"""
+    values = frame.iloc[:, positions].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    values = values[~np.isnan(values).any(axis=1)]
+    return values[:, 0] if len(positions) == 1 else values
+
+
+def iter_excel_frames(file_path, rows=TABLE_CHUNK_ROWS):
+    """逐个工作表按行块读取xlsx文件，每个工作表的第一行为表头"""
+    workbook = open_workbook(file_path)
+    try:
+        for worksheet in workbook.worksheets:
+            row_iter = worksheet.iter_rows(values_only=True)
+            header = next(row_iter, None)
+            if header is None:
+                continue
+            while True:
+                block = list(itertools.islice(row_iter, rows))
+                if not block:
+                    break
+                yield pd.DataFrame.from_records(block, columns=header)
+    finally:
+        workbook.close()
+
+
+def iter_csv_frames(file_path, rows=TABLE_CHUNK_ROWS):
+    """按行块读取csv文件，分隔符和编码根据文件开头自动判断"""
+    encoding = detect_file_encoding(file_path)
+    with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
+        sample = f.read(ENCODING_SAMPLE_SIZE)
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimiter = ','
+    yield from pd.read_csv(file_path, sep=delimiter, encoding=encoding, encoding_errors='ignore',
+                           chunksize=rows, skipinitialspace=True)
+
+
+def extract_table(file_path, queries, timer=NULL_TIMER):
+    """按列提取表格文件（xlsx/csv）：关键词作为表头名称，整列转换为数值"""
+    file_ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+    frames = iter_excel_frames(file_path) if file_ext == 'xlsx' else iter_csv_frames(file_path)
+    parts = [[] for _ in queries]
+    try:
+        for frame in timer.timed(frames, 'decode'):
+            timer.start('parse')
+            for i, query in enumerate(queries):
+                positions = table_columns(frame.columns, query)
+                if positions is not None:
+                    parts[i].append(table_values(frame, positions))
+            timer.stop()
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"读取表格文件失败: {str(e)}")
+    return [np.concatenate(values) if values else collect_values((), query_columns(query))
+            for values, query in zip(parts, queries)]
+
+
+def extract_file(file_path, queries, buffer_size=DEFAULT_BUFFER_SIZE, tabular=False, timer=NULL_TIMER,
+                 pairing=DEFAULT_PAIRING):
+    """一次扫描提取单个文件中所有查询的数值，返回每个查询的数值列表
+
+    tabular 为 True 时 xlsx/csv 文件按列提取，关键词作为表头名称；timer 为 StageTimer 时记录各阶段耗时；
+    pairing 为双值、三值和双关键词值的配对规则，queries 为 QuerySet 时使用其自身的规则。
+    """
+    query_set = get_query_set(queries, pairing)
+    if is_table_file(file_path, tabular):
+        return extract_table(file_path, query_set.queries, timer)
+    file_ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+    if file_ext == 'xlsx':
+        return extract_excel(file_path, query_set, buffer_size, timer)
+    try:
+        return extract_stream(file_path, query_set, buffer_size, timer)
+    except OSError as e:
+        raise ValueError(f"读取文件失败: {str(e)}")
+
+
+def _extract_timed(file_path, query_set, buffer_size, tabular, profile):
+    """提取单个文件，返回 (每个查询的数值列表, 错误信息, 耗时)，profile 为 True 时耗时为 (总秒数, 各阶段)"""
+    timer = StageTimer() if profile else NULL_TIMER
+    start = time.perf_counter()
+    try:
+        values, error = extract_file(file_path, query_set, buffer_size, tabular, timer), None
+    except Exception as e:
+        values, error = None, str(e)
+    return values, error, (time.perf_counter() - start, timer.stages) if profile else None
+
+
+def extract_files(file_paths, queries, buffer_size=DEFAULT_BUFFER_SIZE, tabular=False, profile=False,
+                  pairing=DEFAULT_PAIRING):
+    """进程池任务：依次提取一批文件，返回 (每个查询的数值列表, 错误信息, 耗时) 列表"""
+    query_set = get_query_set(queries, pairing)
+    return [_extract_timed(file_path, query_set, buffer_size, tabular, profile) for file_path in file_paths]
+
+
+def read_file_content(file_path, supported_exts=None):
+    """读取整个文件内容为文本，编码由 detect_file_encoding 判断"""
+    file_ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+    if supported_exts is not None and file_ext not in supported_exts:
+        raise ValueError(f"不支持的文件类型: {file_ext}")
+
+    if file_ext == 'xlsx':
+        return read_excel_text(file_path)
+    try:
+        with open(file_path, 'r', encoding=detect_file_encoding(file_path), errors='ignore') as f:
+            return f.read()
+    except Exception as e:
+        raise ValueError(f"读取{file_ext}文件失败: {str(e)}")
+
+
+def extract_values(content, mode, keyword1, keyword2="", pairing=DEFAULT_PAIRING):
+    """从文本中提取单个模式的数值"""
+    query_set = get_query_set([(mode, keyword1, keyword2)], pairing)
+    return query_set.collect(query_set.finditer(content))[0]
+
+
+class TailFollower:
+    """增量提取持续增长的日志文件
+
+    为每个文件记住已读取的字节位置、解码器和未完成的尾部文本，
+    每次 poll 只读取上次之后追加的内容。最后一行在换行符写入之前不会被提取。
+    文件变小（被截断或轮转）时从头重新读取；xlsx 文件和按列提取的表格文件在修改时间变化时整体重新提取。
+    """
+
+    def __init__(self, queries, buffer_size=DEFAULT_BUFFER_SIZE, tabular=False, pairing=DEFAULT_PAIRING):
+        self.queries = list(queries)
+        self.query_set = get_query_set(self.queries, pairing)
+        self.buffer_size = buffer_size
+        self.tabular = tabular
+        self.pairing = pairing
+        self.states = {}
+
+    def poll(self, file_path):
+        """读取新追加的内容，返回 (每个查询新增的数值列表, 是否需要丢弃此前的结果)"""
+        file_ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+        state = self.states.get(file_path)
+        if file_ext == 'xlsx' or is_table_file(file_path, self.tabular):
+            identity = file_identity(file_path)
+            if state == identity:
+                return [[] for _ in self.queries], False
+            self.states[file_path] = identity
+            return extract_file(file_path, self.query_set, self.buffer_size, self.tabular), state is not None
+
+        size = os.path.getsize(file_path)
+        reset = state is not None and size < state['offset']
+        if state is None or reset:
+            encoding = detect_file_encoding(file_path)
+            query_set = byte_query_set(self.query_set, encoding)
+            decoder = None
+            if query_set is None:
+                query_set = self.query_set
+                decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+            state = {
+                'offset': 0,
+                'decoder': decoder,
+                'query_set': query_set,
+                'scanner': StreamScanner(query_set, max(self.buffer_size, MIN_CARRY)),
+            }
+            self.states[file_path] = state
+
+        matches = []
+        try:
+            with open(file_path, 'rb') as f:
+                f.seek(state['offset'])
+                while True:
+                    raw = f.read(self.buffer_size)
+                    if not raw:
+                        break
+                    state['offset'] += len(raw)
+                    if state['decoder'] is not None:
+                        raw = state['decoder'].decode(raw)
+                    matches.extend(state['scanner'].feed(raw))
+        except OSError as e:
+            raise ValueError(f"读取文件失败: {str(e)}")
+        return state['query_set'].collect(matches), reset
+
+
+def group_statistics(values, offsets, percentiles=STAT_PERCENTILES, correlation=False):
+    """按组向量化计算统计量，同一组的记录须连续存放，第 n 组为 values[offsets[n]:offsets[n + 1]]
+
+    返回字典：'count' 为 (组数,)，'min'/'max'/'range'/'mean'/'std' 为 (组数, 列数)，
+    'percentiles' 为 (百分位数个数, 组数, 列数)，correlation 为 True 时 'corr' 为前两列的相关系数；
+    标准差为总体标准差，没有记录的组统计量为 NaN，少于两条记录或只有一列时相关系数为 NaN。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    groups = len(counts)
+    width = values.shape[1]
+    filled = np.flatnonzero(counts)
+    starts = offsets[filled]
+    sizes = counts[filled]
+
+    def spread(result):
+        full = np.full((groups,) + result.shape[1:], np.nan)
+        full[filled] = result
+        return full
+
+    stats = {'count': counts}
+    if len(filled) == 0:
+        stats.update({name: np.full((groups, width), np.nan) for name in ('min', 'max', 'range', 'mean', 'std')})
+        stats['percentiles'] = np.full((len(percentiles), groups, width), np.nan)
+        if correlation:
+            stats['corr'] = np.full(groups, np.nan)
+        return stats
+
+    # 只保留各组范围内的数据，reduceat 按每组起点分段归约
+    values = values[offsets[0]:offsets[-1]]
+    starts = starts - offsets[0]
+    minimum = np.minimum.reduceat(values, starts, axis=0)
+    maximum = np.maximum.reduceat(values, starts, axis=0)
+    mean = np.add.reduceat(values, starts, axis=0) / sizes[:, None]
+    # 两遍法计算方差，减去组均值后再平方求和，避免大数值相减的精度损失
+    deviation = values - np.repeat(mean, sizes, axis=0)
+    squares = np.add.reduceat(deviation * deviation, starts, axis=0)
+    stats['min'] = spread(minimum)
+    stats['max'] = spread(maximum)
+    stats['range'] = spread(maximum - minimum)
+    stats['mean'] = spread(mean)
+    stats['std'] = spread(np.sqrt(squares / sizes[:, None]))
+
+    if correlation and width < 2:
+        stats['corr'] = np.full(groups, np.nan)
+    elif correlation:
+        products = np.add.reduceat(deviation[:, 0] * deviation[:, 1], starts)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = products / np.sqrt(squares[:, 0] * squares[:, 1])
+        corr[sizes < 2] = np.nan
+        stats['corr'] = spread(corr)
+
+    stats['percentiles'] = np.full((len(percentiles), groups, width), np.nan)
+    if not percentiles:
+        return stats
+
+    # 百分位数：每列排序后各组仍连续存放且组内有序（NaN 排在组末），再按线性插值取各组的位置。
+    # 组较大时逐组原地排序；组很多且很小时先按数值整体排序，再按组序号稳定排序
+    result = np.empty((len(percentiles), len(filled), width))
+    per_group = len(values) >= GROUP_SORT_MIN_SIZE * len(filled)
+    if not per_group:
+        group_index = np.repeat(np.arange(len(filled), dtype=np.int32), sizes)
+    for j in range(width):
+        if per_group:
+            ordered = values[:, j].copy()
+            for start, stop in zip(starts, starts + sizes):
+                ordered[start:stop].sort()
+        else:
+            order = np.argsort(values[:, j])
+            ordered = values[order[np.argsort(group_index[order], kind='stable')], j]
+        for n, q in enumerate(percentiles):
+            position = (sizes - 1) * (q / 100)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, sizes - 1)
+            low = ordered[starts + lower]
+            result[n, :, j] = low + (ordered[starts + upper] - low) * (position - lower)
+    stats['percentiles'][:, filled] = result
+    return stats
+
+
+class QuantileSketch:
+    """可合并的分位数草图（KLL 式逐层压缩），估计值的名次误差与数据量无关，约为总数的 1/capacity 量级
+
+    levels[h] 中的每个数值代表 2^h 个原始数值。某层超过容量时排序后隔一个取一个（起点交替）升入上一层，
+    总权重不变；最高一层容量为 capacity，往下每层乘以 2/3。总数不超过 capacity 时全部数值都在第 0 层，
+    分位数与 np.percentile 的线性插值相同。两个草图合并时逐层拼接再压缩。新数值先暂存，超过第 0 层容量时才压缩。
+    """
+
+    def __init__(self, capacity=SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self._pending = []
+        self._pending_size = 0
+        self._flip = 0
+
+    def _level_capacity(self, h):
+        return max(8, int(self.capacity * (2 / 3) ** (len(self.levels) - 1 - h)))
+
+    def _compact(self):
+        """并入暂存的数值，并逐层压缩超过容量的层"""
+        if self._pending:
+            self.levels[0] = np.concatenate([self.levels[0]] + self._pending)
+            self._pending = []
+            self._pending_size = 0
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self._level_capacity(h):
+                items = np.sort(items)
+                # 个数为奇数时留下一个（交替留最小或最大的），其余两两取一个升入上一层
+                if len(items) % 2:
+                    keep = 0 if self._flip else len(items) - 1
+                    self.levels[h] = items[keep:keep + 1]
+                    items = np.delete(items, keep)
+                else:
+                    self.levels[h] = np.empty(0)
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], items[self._flip::2]])
+                self._flip ^= 1
+            h += 1
+
+    def update(self, values):
+        """加入一批数值，inf/NaN 不计入"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self._pending.append(values)
+        self._pending_size += len(values)
+        self.count += len(values)
+        if len(self.levels[0]) + self._pending_size > self._level_capacity(0):
+            self._compact()
+
+    def merge(self, other):
+        other._compact()
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.count += other.count
+        self._compact()
+
+    def quantiles(self, qs):
+        """各分位数（0~1）的估计值，按权重名次在相邻数值间线性插值，没有数据时为 NaN"""
+        qs = np.asarray(qs, dtype=np.float64)
+        if self.count == 0:
+            return np.full(len(qs), np.nan)
+        self._compact()
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items)
+        items, weights = items[order], weights[order]
+        # 代表 w 个原始数值的元素占据名次 [c - w, c - 1]，取其中点；权重全为 1 时即各数值的名次
+        centers = np.cumsum(weights) - (weights + 1) / 2
+        return np.interp(qs * (self.count - 1), centers, items)
+
+
+class StreamingHistogram:
+    """范围自动扩展的定宽直方图（一维或多维），用于绘图
+
+    第一批数值确定初始范围；之后超出范围的数值使该维桶宽加倍（相邻两桶合并）直到覆盖，已有计数保持精确。
+    桶数固定，更新开销与新数值个数成正比，绘制开销与总数据量无关。
+    """
+
+    def __init__(self, bins=CHART_HIST_BINS, dims=1):
+        self.bins = bins
+        self.dims = dims
+        self.counts = np.zeros((bins,) * dims, dtype=np.int64)
+        self.low = None
+        self.width = None
+
+    def _grow(self, axis, low, high):
+        """沿 axis 维把桶宽加倍，直到范围覆盖 [low, high]"""
+        half = self.bins // 2
+        # 留一点余量，避免浮点误差使正好落在上边界的数值触发扩展
+        while low < self.low[axis] or (high - self.low[axis]) / self.width[axis] > self.bins * (1 + 1e-9):
+            shape = self.counts.shape
+            merged = self.counts.reshape(shape[:axis] + (half, 2) + shape[axis + 1:]).sum(axis=axis + 1)
+            target = [slice(None)] * self.dims
+            if low < self.low[axis]:
+                # 向下扩展：原有数据并入上半部分
+                target[axis] = slice(half, None)
+                self.low[axis] -= self.width[axis] * self.bins
+            else:
+                target[axis] = slice(None, half)
+            self.counts = np.zeros_like(self.counts)
+            self.counts[tuple(target)] = merged
+            self.width[axis] *= 2
+
+    def update(self, values, weights=None):
+        """加入一批数值：一维为 (N,)，多维为 (N, dims)；weights 为每个数值的计数，inf/NaN 不计入"""
+        # 转置为每行一维再归约，比在 (N, dims) 数组上按 axis=0 归约快得多
+        columns = np.ascontiguousarray(np.asarray(values, dtype=np.float64).reshape(-1, self.dims).T)
+        if columns.shape[1] == 0:
+            return
+        low = columns.min(axis=1)
+        high = columns.max(axis=1)
+        if not (np.isfinite(low).all() and np.isfinite(high).all()):
+            finite = np.isfinite(columns).all(axis=0)
+            columns = columns[:, finite]
+            weights = None if weights is None else np.asarray(weights)[finite]
+            if columns.shape[1] == 0:
+                return
+            low = columns.min(axis=1)
+            high = columns.max(axis=1)
+        if self.low is None:
+            span = high - low
+            self.low = low.copy()
+            self.width = np.where(span > 0, span, np.maximum(np.abs(low), 1.0)) / self.bins
+        for axis in range(self.dims):
+            self._grow(axis, low[axis], high[axis])
+        index = ((columns - self.low[:, None]) / self.width[:, None]).astype(np.int64)
+        np.clip(index, 0, self.bins - 1, out=index)
+        flat = np.ravel_multi_index(tuple(index), self.counts.shape)
+        counts = np.bincount(flat, weights=weights, minlength=self.counts.size)
+        self.counts += counts.astype(np.int64).reshape(self.counts.shape)
+
+    def merge(self, other):
+        """并入另一个直方图，对方每个桶按桶中心计入"""
+        occupied = np.nonzero(other.counts)
+        if not len(occupied[0]):
+            return
+        centers = np.column_stack([other.low[axis] + (index + 0.5) * other.width[axis]
+                                   for axis, index in enumerate(occupied)])
+        self.update(centers, other.counts[occupied])
+
+    def binned(self, bins=None):
+        """去掉每一维两端的空桶，指定 bins 时再把每一维合并为不超过 bins 个桶
+
+        返回 (计数, 每一维的边界数组列表)，没有数据时返回 None。
+        """
+        if not self.counts.any():
+            return None
+        counts = self.counts
+        edges = []
+        for axis in range(self.dims):
+            others = tuple(n for n in range(self.dims) if n != axis)
+            occupied = np.flatnonzero(counts.sum(axis=others))
+            first, last = occupied[0], occupied[-1] + 1
+            counts = np.take(counts, np.arange(first, last), axis=axis)
+            group = 1 if bins is None else -(-(last - first) // bins)
+            if group > 1:
+                padding = [(0, 0)] * self.dims
+                padding[axis] = (0, -(last - first) % group)
+                counts = np.pad(counts, padding)
+                shape = counts.shape
+                counts = counts.reshape(shape[:axis] + (shape[axis] // group, group) + shape[axis + 1:]).sum(axis=axis + 1)
+            edges.append(self.low[axis] + self.width[axis] * (first + group * np.arange(counts.shape[axis] + 1)))
+        return counts, edges
+
+
+class RunningStats:
+    """流式统计：个数、最小值、最大值、均值与方差及分位数草图，每列独立统计
+
+    每批数值先求批内均值与离差平方和，再按 Welford/Chan 合并公式并入已有结果，与一次性计算全部数据等价；
+    两个 RunningStats 可以直接合并。两列以上时同时累计前两列的协乘积和，用于计算相关系数。
+    sketch 为 False 时不维护分位数草图；charts 为 True 时另外维护每列的直方图及前两列的二维密度图，供绘图使用。
+    """
+
+    def __init__(self, width=1, sketch=True, charts=False):
+        self.width = width
+        self.count = 0
+        self.minimum = np.full(width, np.nan)
+        self.maximum = np.full(width, np.nan)
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+        self.comoment = 0.0
+        self.sketches = [QuantileSketch() for _ in range(width)] if sketch else None
+        self.histograms = [StreamingHistogram() for _ in range(width)] if charts else None
+        self.density = StreamingHistogram(CHART_DENSITY_BINS, 2) if charts and width > 1 else None
+
+    def _combine(self, count, minimum, maximum, mean, m2, comoment):
+        if count == 0:
+            return
+        if self.count == 0:
+            self.count, self.minimum, self.maximum = count, minimum.copy(), maximum.copy()
+            self.mean, self.m2, self.comoment = mean.copy(), m2.copy(), comoment
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        weight = self.count * count / total
+        self.m2 = self.m2 + m2 + delta * delta * weight
+        if self.width > 1:
+            self.comoment += comoment + delta[0] * delta[1] * weight
+        self.mean = self.mean + delta * (count / total)
+        self.minimum = np.fmin(self.minimum, minimum)
+        self.maximum = np.fmax(self.maximum, maximum)
+        self.count = total
+
+    def update(self, values):
+        """并入一批数值，单列为 (N,)，多列为 (N, width)"""
+        values = np.asarray(values, dtype=np.float64).reshape(-1, self.width)
+        if len(values) == 0:
+            return
+        # 转置为每行一列再归约，比在 (N, width) 数组上按 axis=0 归约快得多
+        columns = np.ascontiguousarray(values.T)
+        mean = columns.mean(axis=1)
+        deviation = columns - mean[:, None]
+        comoment = float(deviation[0] @ deviation[1]) if self.width > 1 else 0.0
+        self._combine(len(values), columns.min(axis=1), columns.max(axis=1), mean,
+                      np.einsum('ij,ij->i', deviation, deviation), comoment)
+        if self.sketches is not None:
+            for sketch, column in zip(self.sketches, columns):
+                sketch.update(column)
+        if self.histograms is not None:
+            for histogram, column in zip(self.histograms, columns):
+                histogram.update(column)
+        if self.density is not None:
+            self.density.update(values[:, :2])
+
+    def merge(self, other):
+        self._combine(other.count, other.minimum, other.maximum, other.mean, other.m2, other.comoment)
+        if self.sketches is not None and other.sketches is not None:
+            for sketch, others in zip(self.sketches, other.sketches):
+                sketch.merge(others)
+        if self.histograms is not None and other.histograms is not None:
+            for histogram, others in zip(self.histograms, other.histograms):
+                histogram.merge(others)
+        if self.density is not None and other.density is not None:
+            self.density.merge(other.density)
+
+    def std(self):
+        """各列的总体标准差，没有数据时为 NaN"""
+        if self.count == 0:
+            return np.full(self.width, np.nan)
+        return np.sqrt(self.m2 / self.count)
+
+    def corr(self):
+        """前两列的相关系数，少于两条记录或只有一列时为 NaN"""
+        if self.count < 2 or self.width < 2:
+            return np.nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.comoment / np.sqrt(self.m2[0] * self.m2[1])
+
+    def quantiles(self, percentiles=STAT_PERCENTILES):
+        """各列百分位数的草图估计值，形状为 (百分位数个数, 列数)，并限制在最小值与最大值之间"""
+        if self.count == 0 or self.sketches is None:
+            return np.full((len(percentiles), self.width), np.nan)
+        qs = np.asarray(percentiles, dtype=np.float64) / 100
+        estimates = np.column_stack([sketch.quantiles(qs) for sketch in self.sketches])
+        return np.clip(estimates, self.minimum, self.maximum)
+
+
+def running_statistics(file_stats, percentiles=STAT_PERCENTILES, correlation=False):
+    """由每组的 RunningStats 组成与 group_statistics 相同格式的统计结果，百分位数为草图估计值"""
+    counts = np.array([stats.count for stats in file_stats], dtype=np.int64)
+    width = file_stats[0].width if file_stats else 1
+    empty = counts == 0
+
+    def rows(arrays):
+        result = np.array(arrays, dtype=np.float64).reshape(len(counts), width)
+        result[empty] = np.nan
+        return result
+
+    minimum = rows([stats.minimum for stats in file_stats])
+    maximum = rows([stats.maximum for stats in file_stats])
+    result = {
+        'count': counts,
+        'min': minimum,
+        'max': maximum,
+        'range': maximum - minimum,
+        'mean': rows([stats.mean for stats in file_stats]),
+        'std': rows([stats.std() for stats in file_stats]),
+        'percentiles': np.array([stats.quantiles(percentiles) for stats in file_stats],
+                                dtype=np.float64).reshape(len(counts), len(percentiles), width).transpose(1, 0, 2),
+    }
+    if correlation:
+        result['corr'] = np.array([stats.corr() for stats in file_stats], dtype=np.float64)
+    return result
+
+
+class ResultStore:
+    """列式结果存储
+
+    每个查询的数值保存在一块连续的 float64 数组中，并另有一列记录每条记录所属的文件序号；
+    按文件序号排序后用二分查找定位每个文件的数据，不再为每个数值创建 Python 对象。
+    文件以完整路径为键，不同文件夹中的同名文件互不覆盖。
+
+    保存结果的同时为每个查询累计全部文件的流式统计（summary，含绘图用的直方图），提取过程中即可显示。
+    keep_values 为 False 时只统计、不保存原始数值：每个文件单独累计 RunningStats，
+    values/get/items 返回空数组，statistics 的百分位数为草图估计值。
+    """
+
+    def __init__(self, queries, keep_values=True):
+        self.queries = list(queries)
+        self.keep_values = keep_values
+        self.paths = []
+        self.index = {}
+        self.lock = threading.RLock()
+        self._values = [np.empty((0, query_columns(query))) for query in self.queries]
+        self._file_ids = [np.empty(0, dtype=np.int32) for _ in self.queries]
+        self._sizes = [0] * len(self.queries)
+        self._sorted = [True] * len(self.queries)
+        self._summaries = [RunningStats(query_columns(query), charts=True) for query in self.queries]
+        self._pending = [[] for _ in self.queries]
+        self._pending_sizes = [0] * len(self.queries)
+        self._file_stats = [[] for _ in self.queries]
+        # 每个查询中每个文件的记录数，随保存和删除同步更新，查询某个文件的记录数不需要排序或扫描全部数值
+        self._counts = [[] for _ in self.queries]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, file_path):
+        return file_path in self.index
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def _reserve(self, i, extra):
+        """保证第 i 个查询的数组还能容纳 extra 条记录，容量不足时按倍数扩展"""
+        size = self._sizes[i]
+        values = self._values[i]
+        if size + extra <= len(values):
+            return
+        capacity = max(size + extra, 2 * len(values), 1024)
+        grown = np.empty((capacity, values.shape[1]))
+        grown[:size] = values[:size]
+        file_ids = np.empty(capacity, dtype=np.int32)
+        file_ids[:size] = self._file_ids[i][:size]
+        self._values[i] = grown
+        self._file_ids[i] = file_ids
+
+    def _remove(self, file_id):
+        """删除一个文件已有的全部记录，有记录被删除的查询需要重新计算全局统计"""
+        for counts in self._counts:
+            counts[file_id] = 0
+        for i, file_stats in enumerate(self._file_stats):
+            if file_stats and file_stats[file_id].count:
+                file_stats[file_id] = RunningStats(self._values[i].shape[1])
+                self._summaries[i] = None
+        for i, size in enumerate(self._sizes):
+            keep = np.flatnonzero(self._file_ids[i][:size] != file_id)
+            if len(keep) == size:
+                continue
+            self._summaries[i] = None
+            self._values[i][:len(keep)] = self._values[i][keep]
+            self._file_ids[i][:len(keep)] = self._file_ids[i][keep]
+            self._sizes[i] = len(keep)
+
+    def _sort(self, i):
+        """按文件序号稳定排序，使同一文件的记录连续存放"""
+        if self._sorted[i]:
+            return
+        size = self._sizes[i]
+        order = np.argsort(self._file_ids[i][:size], kind='stable')
+        self._values[i][:size] = self._values[i][order]
+        self._file_ids[i][:size] = self._file_ids[i][order]
+        self._sorted[i] = True
+
+    def _view(self, i, start, stop):
+        values = self._values[i][start:stop]
+        return values[:, 0] if values.shape[1] == 1 else values
+
+    def add(self, file_path, results, append=False):
+        """保存一个文件的结果（每个查询一个数组），append 为 False 时替换该文件已有的结果"""
+        with self.lock:
+            file_id = self.index.get(file_path)
+            if file_id is None:
+                file_id = len(self.paths)
+                self.index[file_path] = file_id
+                self.paths.append(file_path)
+                for counts in self._counts:
+                    counts.append(0)
+                if not self.keep_values:
+                    for i, file_stats in enumerate(self._file_stats):
+                        file_stats.append(RunningStats(self._values[i].shape[1]))
+            elif not append:
+                self._remove(file_id)
+
+            for i, values in enumerate(results):
+                values = np.asarray(values, dtype=np.float64).reshape(-1, self._values[i].shape[1])
+                if len(values) == 0:
+                    continue
+                self._counts[i][file_id] += len(values)
+                if self._summaries[i] is not None:
+                    # 小文件逐个更新统计的固定开销较大，先暂存，累计到 SKETCH_FLUSH 行或读取统计时一起并入
+                    self._pending[i].append(values.copy())
+                    self._pending_sizes[i] += len(values)
+                    if self._pending_sizes[i] >= SKETCH_FLUSH:
+                        self._flush_summary(i)
+                if not self.keep_values:
+                    self._file_stats[i][file_id].update(values)
+                    continue
+                self._reserve(i, len(values))
+                start = self._sizes[i]
+                stop = start + len(values)
+                if start and self._file_ids[i][start - 1] > file_id:
+                    self._sorted[i] = False
+                self._values[i][start:stop] = values
+                self._file_ids[i][start:stop] = file_id
+                self._sizes[i] = stop
+
+    def get(self, file_path):
+        """一个文件的结果：每个查询一个数组（单值为 (N,)，其余为 (N, k)）"""
+        with self.lock:
+            file_id = self.index[file_path]
+            results = []
+            for i, size in enumerate(self._sizes):
+                self._sort(i)
+                start, stop = np.searchsorted(self._file_ids[i][:size], (file_id, file_id + 1))
+                results.append(self._view(i, start, stop))
+            return results
+
+    def values(self, i=0):
+        """第 i 个查询在所有文件中的全部数值"""
+        with self.lock:
+            return self._view(i, 0, self._sizes[i])
+
+    def file_ids(self, i=0):
+        """第 i 个查询每条记录所属的文件序号（与 values(i) 一一对应）"""
+        with self.lock:
+            return self._file_ids[i][:self._sizes[i]]
+
+    def offsets(self, i=0):
+        """第 i 个查询按文件排序后的偏移量，第 n 个文件的数据为 values(i)[offsets[n]:offsets[n + 1]]"""
+        with self.lock:
+            self._sort(i)
+            return np.searchsorted(self._file_ids[i][:self._sizes[i]], np.arange(len(self.paths) + 1))
+
+    def counts(self, file_path):
+        """一个文件在每个查询中的记录数"""
+        with self.lock:
+            file_id = self.index[file_path]
+            return [counts[file_id] for counts in self._counts]
+
+    def file_counts(self):
+        """每个文件在所有查询中找到的记录数"""
+        with self.lock:
+            return np.array(self._counts, dtype=np.int64).reshape(len(self._counts), len(self.paths)).sum(axis=0)
+
+    def _flush_summary(self, i):
+        if self._pending[i]:
+            self._summaries[i].update(np.concatenate(self._pending[i]))
+        self._pending[i] = []
+        self._pending_sizes[i] = 0
+
+    def summary(self, i=0):
+        """第 i 个查询在全部文件中的流式统计（RunningStats），删除或替换过记录时重新累计"""
+        with self.lock:
+            if self._summaries[i] is not None:
+                self._flush_summary(i)
+            else:
+                self._pending[i] = []
+                self._pending_sizes[i] = 0
+                summary = RunningStats(self._values[i].shape[1], charts=True)
+                if self.keep_values:
+                    summary.update(self._values[i][:self._sizes[i]])
+                else:
+                    for file_stats in self._file_stats[i]:
+                        summary.merge(file_stats)
+                self._summaries[i] = summary
+            return self._summaries[i]
+
+    def statistics(self, i=0, percentiles=STAT_PERCENTILES, correlation=False):
+        """第 i 个查询按文件分组的统计量，第 n 组对应 paths[n]，格式见 group_statistics
+
+        保存了原始数值时精确计算；只统计时由每个文件的 RunningStats 得出，百分位数为草图估计值。
+        """
+        with self.lock:
+            if not self.keep_values:
+                return running_statistics(self._file_stats[i], percentiles, correlation)
+            offsets = self.offsets(i)
+            return group_statistics(self._values[i][:self._sizes[i]], offsets, percentiles, correlation)
+
+    def items(self, i=None):
+        """按文件顺序返回 (完整路径, 结果)；指定 i 时结果为该查询的数组，否则为每个查询的数组列表"""
+        with self.lock:
+            indices = range(len(self.queries)) if i is None else [i]
+            offsets = [self.offsets(n) for n in indices]
+            for file_id, file_path in enumerate(self.paths):
+                results = [self._view(n, offset[file_id], offset[file_id + 1])
+                           for n, offset in zip(indices, offsets)]
+                yield file_path, (results if i is None else results[0])
+
+    def select(self, file_paths):
+        """只包含指定文件的结果快照，文件顺序不变
+
+        只在复制数值、文件序号和路径时持有锁；之后读取快照（如导出）不占用本结果集的锁，提取和界面刷新不会被阻塞。
+        """
+        with self.lock:
+            wanted = set(file_paths)
+            keep = [file_id for file_id, file_path in enumerate(self.paths) if file_path in wanted]
+            subset = ResultStore(self.queries, self.keep_values)
+            remap = np.full(len(self.paths), -1, dtype=np.int32)
+            remap[keep] = np.arange(len(keep), dtype=np.int32)
+            subset.paths = [self.paths[file_id] for file_id in keep]
+            subset.index = {file_path: n for n, file_path in enumerate(subset.paths)}
+            for i, size in enumerate(self._sizes):
+                file_ids = remap[self._file_ids[i][:size]]
+                mask = file_ids >= 0
+                subset._values[i] = self._values[i][:size][mask]
+                subset._file_ids[i] = file_ids[mask]
+                subset._sizes[i] = len(subset._file_ids[i])
+                subset._sorted[i] = self._sorted[i]
+                subset._summaries[i] = None
+                subset._counts[i] = [self._counts[i][file_id] for file_id in keep]
+                if not self.keep_values:
+                    # 跟踪模式下原结果集会继续并入新数据，快照中的每个文件统计单独复制
+                    subset._file_stats[i] = []
+                    for file_id in keep:
+                        stats = RunningStats(self._values[i].shape[1])
+                        stats.merge(self._file_stats[i][file_id])
+                        subset._file_stats[i].append(stats)
+            return subset
+
+    def clear(self):
+        with self.lock:
+            self.paths = []
+            self.index = {}
+            self._values = [np.empty((0, values.shape[1])) for values in self._values]
+            self._file_ids = [np.empty(0, dtype=np.int32) for _ in self.queries]
+            self._sizes = [0] * len(self.queries)
+            self._sorted = [True] * len(self.queries)
+            self._summaries = [RunningStats(values.shape[1], charts=True) for values in self._values]
+            self._pending = [[] for _ in self.queries]
+            self._pending_sizes = [0] * len(self.queries)
+            self._file_stats = [[] for _ in self.queries]
+            self._counts = [[] for _ in self.queries]
+
+
+def file_identity(file_path):
+    """缓存键中的文件标识：(绝对路径, 大小, 修改时间)"""
+    st = os.stat(file_path)
+    return os.path.abspath(file_path), st.st_size, st.st_mtime_ns
+
+
+class ResultCache:
+    """持久化的提取结果缓存
+
+    以 (绝对路径, 大小, 修改时间, 模式, 关键词, 是否按列提取, 配对规则) 为键，数值以 float64 二进制保存在 SQLite 中；
+    配对规则只影响按文本提取、模板中含间隔的查询（双值、双关键词值、三值等），其余查询的键中为空。
+    同一文件同一查询只保留最新的一条，总大小超过 max_bytes 时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, db_path, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS results")
+            self.conn.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "path TEXT, mode INTEGER, keyword1 TEXT, keyword2 TEXT, tabular INTEGER, pairing TEXT, size INTEGER, "
+            "mtime INTEGER, data BLOB, used REAL, PRIMARY KEY (path, mode, keyword1, keyword2, tabular, pairing))"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def _pairing(query, tabular, pairing):
+        return pairing if query_template(query).gaps and not tabular else ""
+
+    def _rows(self, identity, queries, columns, tabular, pairing):
+        path, size, mtime = identity
+        rows = []
+        for query in queries:
+            mode, keyword1, keyword2 = query
+            row = self.conn.execute(
+                f"SELECT {columns} FROM results WHERE path=? AND mode=? AND keyword1=? AND keyword2=? "
+                "AND tabular=? AND pairing=? AND size=? AND mtime=?",
+                (path, mode, keyword1, keyword2, int(tabular), self._pairing(query, tabular, pairing), size,
+                 mtime)).fetchone()
+            if row is None:
+                return None
+            rows.append(row)
+        return rows
+
+    def has(self, identity, queries, tabular=False, pairing=DEFAULT_PAIRING):
+        """所有查询是否都已缓存"""
+        with self.lock:
+            return self._rows(identity, queries, "1", tabular, pairing) is not None
+
+    def load(self, identity, queries, tabular=False, pairing=DEFAULT_PAIRING):
+        """读取缓存的结果，未全部命中时返回 None"""
+        with self.lock:
+            rows = self._rows(identity, queries, "data", tabular, pairing)
+            if rows is None:
+                return None
+            self.conn.execute(
+                "UPDATE results SET used=? WHERE path=?", (time.time(), identity[0]))
+
+        results = []
+        for (data,), query in zip(rows, queries):
+            array = np.frombuffer(data, dtype=np.float64).copy()
+            columns = query_columns(query)
+            results.append(array if columns == 1 else array.reshape(-1, columns))
+        return results
+
+    def store(self, identity, queries, results, tabular=False, pairing=DEFAULT_PAIRING):
+        """保存一个文件的提取结果"""
+        path, size, mtime = identity
+        now = time.time()
+        with self.lock:
+            for query, values in zip(queries, results):
+                mode, keyword1, keyword2 = query
+                data = np.asarray(values, dtype=np.float64).tobytes()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (path, mode, keyword1, keyword2, int(tabular), self._pairing(query, tabular, pairing), size,
+                     mtime, data, now))
+
+    def flush(self):
+        """提交写入并按容量上限淘汰旧条目"""
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM results").fetchone()[0]
+            if total > self.max_bytes:
+                expired = []
+                for rowid, length in self.conn.execute("SELECT rowid, LENGTH(data) FROM results ORDER BY used"):
+                    if total <= self.max_bytes * 0.9:
+                        break
+                    expired.append((rowid,))
+                    total -= length
+                self.conn.executemany("DELETE FROM results WHERE rowid=?", expired)
+            self.conn.commit()
+
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            self.conn.execute("DELETE FROM results")
+            self.conn.commit()
+            self.conn.execute("VACUUM")
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+class PerfRecorder:
+    """汇总一次运行的性能数据：每个文件各阶段的耗时和数据量、各阶段合计及最慢的文件
+
+    提取阶段的明细由 StageTimer 在提取文件的进程中记录，保存结果、界面刷新、导出等阶段由调用方用 add 记录；
+    所有方法线程安全。不需要记录时调用方传入 None，提取过程中不做任何计时。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # 阶段 -> [秒数, 字节数, 次数]
+        self.totals = {}
+        # 文件路径 -> [总秒数, {阶段: [秒数, 字节数]}]
+        self.files = {}
+        self.started = time.perf_counter()
+        self.finished = None
+        self.profile_text = ""
+        self.memory_text = ""
+
+    def _add(self, stage, seconds, nbytes, calls):
+        entry = self.totals.setdefault(stage, [0.0, 0, 0])
+        entry[0] += seconds
+        entry[1] += nbytes
+        entry[2] += calls
+
+    def add(self, stage, seconds, nbytes=0, calls=1):
+        """累加一个阶段的耗时（秒）、数据量（字节）和次数"""
+        with self.lock:
+            self._add(stage, seconds, nbytes, calls)
+
+    def add_file(self, file_path, seconds, stages):
+        """记录一个文件的提取耗时及 StageTimer 的各阶段明细，同一文件多次提取时累加"""
+        with self.lock:
+            record = self.files.setdefault(file_path, [0.0, {}])
+            record[0] += seconds
+            for stage, (stage_seconds, nbytes) in (stages or {}).items():
+                entry = record[1].setdefault(stage, [0.0, 0])
+                entry[0] += stage_seconds
+                entry[1] += nbytes
+                self._add(stage, stage_seconds, nbytes, 1)
+
+    def finish(self):
+        """记录结束时间，报告中的总耗时到此为止；之后再记录（如导出）时可以再次调用"""
+        self.finished = time.perf_counter()
+
+    @property
+    def wall_seconds(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @contextlib.contextmanager
+    def capture(self, profile=False, memory=False):
+        """在 with 块运行期间附加 cProfile（只统计当前线程）和 tracemalloc（整个进程）采样，结果写入报告
+
+        并行提取时文件在子进程中处理，cProfile 中只有调度和保存结果的开销。
+        """
+        profiler = cProfile.Profile() if profile else None
+        tracing = memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PERF_PROFILE_LINES)
+                self.profile_text = out.getvalue()
+            if memory:
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics('lineno')[:PERF_PROFILE_LINES]
+                lines = [f"当前 {current / (1024 * 1024):.1f} MB，峰值 {peak / (1024 * 1024):.1f} MB"]
+                self.memory_text = "\n".join(lines + [str(stat) for stat in top])
+                if tracing:
+                    tracemalloc.stop()
+
+    def report(self, slowest=PERF_SLOWEST):
+        """性能报告：总耗时、按处理顺序排列的各阶段合计及耗时最长的 slowest 个文件，slowest 为 None 时列出全部文件
+
+        占比为阶段耗时占所有阶段耗时之和的比例；并行提取时各阶段之和可能大于总耗时。
+        """
+        order = list(PERF_STAGES)
+        with self.lock:
+            total = sum(entry[0] for entry in self.totals.values())
+            stages = [{
+                'stage': stage,
+                'name': PERF_STAGES.get(stage, stage),
+                'seconds': seconds,
+                'bytes': nbytes,
+                'calls': calls,
+                'share': seconds / total if total else 0.0,
+                'mb_per_s': nbytes / (1024 * 1024) / seconds if nbytes and seconds else None,
+            } for stage, (seconds, nbytes, calls) in
+                sorted(self.totals.items(), key=lambda item: order.index(item[0]) if item[0] in order else len(order))]
+            files = sorted(self.files.items(), key=lambda item: item[1][0], reverse=True)
+            files = [{
+                'file': file_path,
+                'seconds': seconds,
+                'bytes': stages.get('read', (0, 0))[1],
+                'stages': {stage: {'seconds': entry[0], 'bytes': entry[1]} for stage, entry in stages.items()},
+            } for file_path, (seconds, stages) in (files if slowest is None else files[:slowest])]
+        return {
+            'wall_seconds': self.wall_seconds,
+            'file_count': len(self.files),
+            'stages': stages,
+            'files': files,
+            'profile': self.profile_text,
+            'memory': self.memory_text,
+        }
+
+    def export(self, file_path):
+        """导出包含全部文件的报告：扩展名为 .csv 时每个文件每个阶段一行，否则写为 JSON"""
+        report = self.report(None)
+        if os.path.splitext(file_path)[1].lower() != '.csv':
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            return
+        with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('文件名', '阶段', '耗时(秒)', '字节数', '次数'))
+            writer.writerow(('全部', '总耗时', round(report['wall_seconds'], 6), '', ''))
+            for stage in report['stages']:
+                writer.writerow(('全部', stage['name'], round(stage['seconds'], 6), stage['bytes'], stage['calls']))
+            for record in report['files']:
+                writer.writerow((record['file'], '合计', round(record['seconds'], 6), record['bytes'], ''))
+                for stage, entry in record['stages'].items():
+                    writer.writerow((record['file'], PERF_STAGES.get(stage, stage), round(entry['seconds'], 6),
+                                     entry['bytes'], ''))
+
+
+def _iter_tasks(tasks, queries, buffer_size, workers, stop_event, tabular=False, profile=False,
+                pairing=DEFAULT_PAIRING):
+    """按 tasks 的顺序返回 (文件路径, 每个查询的数值列表, 错误信息, 耗时)，workers 大于 1 时使用进程池"""
+    if workers <= 1 or len(tasks) <= 1:
+        query_set = get_query_set(queries, pairing)
+        for file_path in tasks:
+            if stop_event.is_set():
+                return
+            yield (file_path,) + _extract_timed(file_path, query_set, buffer_size, tabular, profile)
+        return
+
+    batch_size = max(1, min(PARALLEL_BATCH_MAX, len(tasks) // (workers * 4)))
+    batches = [tasks[i:i + batch_size] for i in range(0, len(tasks), batch_size)]
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    futures = {executor.submit(extract_files, batch, queries, buffer_size, tabular, profile, pairing): idx
+               for idx, batch in enumerate(batches)}
+    finished = {}
+    next_batch = 0
+    try:
+        not_done = set(futures)
+        while next_batch < len(batches):
+            if stop_event.is_set():
+                return
+
+            if next_batch not in finished:
+                done, not_done = wait(not_done, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx = futures[future]
+                    try:
+                        finished[idx] = future.result()
+                    except Exception as e:
+                        finished[idx] = [(None, str(e), None)] * len(batches[idx])
+                continue
+
+            # 按文件列表中的顺序返回已完成的结果
+            for file_path, result in zip(batches[next_batch], finished.pop(next_batch)):
+                yield (file_path,) + result
+            next_batch += 1
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_extract(file_paths, queries, buffer_size=DEFAULT_BUFFER_SIZE, workers=1, supported_exts=None,
+                 stop_event=None, progress=None, cache=None, tabular=False, perf=None, pairing=DEFAULT_PAIRING):
+    """按输入顺序逐个返回 (文件路径, 每个查询的数值列表, 错误信息)
+
+    workers 大于 1 时使用进程池并行提取，结果仍按 file_paths 的顺序返回；
+    cache 为 ResultCache 时跳过未修改的文件并直接读取缓存结果；tabular 为 True 时 xlsx/csv 文件按列提取；
+    stop_event 被设置后停止返回结果，progress(已完成数, 总数) 用于报告进度；
+    perf 为 PerfRecorder 时记录每个文件各阶段的耗时及缓存读写耗时；pairing 为双值、三值和双关键词值的配对规则。
+    """
+    stop_event = stop_event or threading.Event()
+    total_files = len(file_paths)
+    unsupported = set()
+    if supported_exts is not None:
+        for file_path in file_paths:
+            if os.path.splitext(file_path)[1].lower().lstrip('.') not in supported_exts:
+                unsupported.add(file_path)
+
+    identities = {}
+    cached = set()
+    tasks = []
+    start = time.perf_counter()
+    for file_path in file_paths:
+        if file_path in unsupported:
+            continue
+        if cache is not None:
+            try:
+                identities[file_path] = file_identity(file_path)
+                if cache.has(identities[file_path], queries, is_table_file(file_path, tabular), pairing):
+                    cached.add(file_path)
+                    continue
+            except OSError:
+                pass
+        tasks.append(file_path)
+    if perf is not None and cache is not None:
+        perf.add('cache', time.perf_counter() - start)
+
+    profile = perf is not None
+    runner = _iter_tasks(tasks, queries, buffer_size, workers, stop_event, tabular, profile, pairing)
+    try:
+        for i, file_path in enumerate(file_paths):
+            if stop_event.is_set():
+                return
+
+            if file_path in unsupported:
+                file_ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+                yield file_path, None, f"不支持的文件类型: {file_ext}"
+                continue
+
+            table = is_table_file(file_path, tabular)
+            start = time.perf_counter()
+            results = cache.load(identities[file_path], queries, table, pairing) if file_path in cached else None
+            if profile and file_path in cached:
+                perf.add('cache', time.perf_counter() - start)
+            if results is not None:
+                yield file_path, results, None
+            else:
+                if file_path in cached:
+                    results, error, timing = extract_files([file_path], queries, buffer_size, tabular, profile,
+                                                           pairing)[0]
+                else:
+                    try:
+                        _, results, error, timing = next(runner)
+                    except StopIteration:
+                        return
+                if timing is not None:
+                    perf.add_file(file_path, *timing)
+                if error is None and file_path in identities:
+                    start = time.perf_counter()
+                    cache.store(identities[file_path], queries, results, table, pairing)
+                    if profile:
+                        perf.add('cache', time.perf_counter() - start)
+                yield file_path, results, error
+
+            if progress:
+                progress(i + 1, total_files)
+    finally:
+        runner.close()
+        if cache is not None:
+            start = time.perf_counter()
+            cache.flush()
+            if perf is not None:
+                perf.add('cache', time.perf_counter() - start)
+
+
+def extract_numeric_value(filename):
+    """文件名中的第一个数字，用于排序"""
+    try:
+        match = re.search(r'(-?\d+\.?\d*)', filename)
+        if match:
+            return float(match.group(1))
+        return None
+    except:
+        return None
+
+
+def sort_files_by_numeric_value(files):
+    def get_numeric_value(file_path):
+        filename = os.path.basename(file_path)
+        value = extract_numeric_value(filename)
+        return value if value is not None else float('inf')
+
+    return sorted(files, key=get_numeric_value)
+
+
+def file_labels(paths, extension=True):
+    """文件的显示名称：文件名（extension 为 False 时不含扩展名），与其他文件重名时为相对于共同上级目录的路径"""
+    def strip(name):
+        return name if extension else os.path.splitext(name)[0]
+
+    names = [strip(os.path.basename(path)) for path in paths]
+    if len(set(names)) == len(names):
+        return names
+    full_paths = [os.path.abspath(path) for path in paths]
+    try:
+        root = os.path.commonpath([os.path.dirname(path) for path in full_paths])
+    except ValueError:
+        # 不在同一驱动器上，使用完整路径
+        root = None
+    relative = [path if root is None else os.path.relpath(path, root) for path in full_paths]
+    # 去掉扩展名后仍重名（同一目录下只有扩展名不同）时保留扩展名
+    stripped = [strip(path) for path in relative]
+    repeated = {name for name in names if names.count(name) > 1}
+    repeated_paths = {name for name in stripped if stripped.count(name) > 1}
+    return [(path if short in repeated_paths else short) if name in repeated else name
+            for name, short, path in zip(names, stripped, relative)]
+
+
+def collect_paths(patterns, exts):
+    """展开文件、文件夹和通配符，返回扩展名符合要求的文件"""
+    files = []
+    for pattern in patterns:
+        matched = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for path in matched:
+            if os.path.isdir(path):
+                for root, _, filenames in os.walk(path):
+                    for filename in filenames:
+                        if os.path.splitext(filename)[1].lower().lstrip('.') in exts:
+                            files.append(os.path.join(root, filename))
+            elif os.path.isfile(path) and os.path.splitext(path)[1].lower().lstrip('.') in exts:
+                files.append(path)
+    return list(dict.fromkeys(files))
+
+
+class ExportCancelled(Exception):
+    """导出被取消"""
+
+
+def iter_block_rows(count, columns):
+    """将列块展开为行：数组列逐行取值，标量列在每行重复，NaN 写为空单元格"""
+    cells = []
+    for column in columns:
+        if isinstance(column, np.ndarray):
+            cells.append(cell_values(column))
+        else:
+            cells.append(itertools.repeat(None if isinstance(column, float) and column != column else column, count))
+    return zip(*cells)
+
+
+class ExportWriter:
+    """导出写入器基类
+
+    每个逻辑工作表由表头和若干列块组成，列块为 (行数, 列列表)，列为数组或在每行重复的标量；
+    progress(已写入行数, 预计总行数) 用于报告进度，stop_event 被设置后抛出 ExportCancelled。
+    """
+
+    def __init__(self, total_rows=0, progress=None, stop_event=None):
+        self.total_rows = total_rows
+        self.progress = progress
+        self.stop_event = stop_event or threading.Event()
+        self.written = 0
+
+    def _advance(self, rows):
+        """累计已写入的行数，每写入 EXPORT_PROGRESS_ROWS 行检查一次取消并报告进度"""
+        before = self.written // EXPORT_PROGRESS_ROWS
+        self.written += rows
+        if self.written // EXPORT_PROGRESS_ROWS != before:
+            if self.stop_event.is_set():
+                self._cancel()
+            if self.progress:
+                self.progress(self.written, max(self.total_rows, self.written))
+
+    def _cancel(self):
+        raise ExportCancelled()
+
+    def write_blocks(self, title, header, blocks):
+        raise NotImplementedError
+
+    def write_records(self, title, records):
+        """写入字典列表，列为所有键的并集（按首次出现的顺序），缺少的键为空"""
+        header = list(dict.fromkeys(key for record in records for key in record))
+        self.write_blocks(title, header, ((1, [record.get(key) for key in header]) for record in records))
+
+    def save(self):
+        if self.stop_event.is_set():
+            self._cancel()
+        if self.progress:
+            self.progress(self.written, self.written)
+
+
+class ExcelStreamWriter(ExportWriter):
+    """流式写入 xlsx 文件：使用 openpyxl 只写工作簿逐行写入，内存占用与行数无关
+
+    一个工作表超过 Excel 行数上限时自动续写到 名称_2、名称_3 …，每页都重复表头。
+    """
+
+    def __init__(self, file_path, total_rows=0, progress=None, stop_event=None):
+        super().__init__(total_rows, progress, stop_event)
+        self.file_path = file_path
+        self.workbook = Workbook(write_only=True)
+
+    def _new_sheet(self, title, header):
+        sheet = self.workbook.create_sheet(title)
+        sheet.append(header)
+        return sheet
+
+    def write_blocks(self, title, header, blocks):
+        """将列块逐行写入名为 title 的工作表，行数超过上限时新建续表"""
+        part = 1
+        sheet = self._new_sheet(title, header)
+        used = 1
+        for count, columns in blocks:
+            for row in iter_block_rows(count, columns):
+                if used >= EXCEL_MAX_ROWS:
+                    part += 1
+                    sheet = self._new_sheet(f'{title}_{part}', header)
+                    used = 1
+                sheet.append(row)
+                used += 1
+                self._advance(1)
+
+    def _cancel(self):
+        """关闭已创建的工作表（释放临时文件）后抛出 ExportCancelled，不写入目标文件"""
+        for sheet in self.workbook.worksheets:
+            sheet.close()
+        raise ExportCancelled()
+
+    def save(self):
+        if self.stop_event.is_set():
+            self._cancel()
+        self.workbook.save(self.file_path)
+        super().save()
+
+
+def block_columns(header, pending):
+    """把若干列块拼接为整列：文本列为 Categorical（每块只保存一次文本），其余列为数值数组
+
+    标量在块内重复，数值列中的“未找到”“N/A”等文本占位记为空值。
+    """
+    counts = np.array([count for count, _ in pending], dtype=np.int64)
+    columns = {}
+    for n, name in enumerate(header):
+        if name in TEXT_COLUMNS:
+            labels = pd.Categorical([None if column[n] is None else str(column[n]) for _, column in pending])
+            columns[name] = pd.Categorical.from_codes(np.repeat(labels.codes, counts), labels.categories)
+            continue
+
+        pieces = []
+        for count, column in pending:
+            value = column[n]
+            if isinstance(value, np.ndarray):
+                pieces.append(value)
+            elif value is None or isinstance(value, str):
+                pieces.append(np.full(count, np.nan))
+            else:
+                pieces.append(np.full(count, value))
+        values = np.concatenate(pieces) if pieces else np.empty(0)
+        if name in INTEGER_COLUMNS and values.dtype.kind == 'f':
+            values = pd.array(values, dtype='Int64')
+        columns[name] = values
+    return columns
+
+
+def import_pyarrow():
+    """导入 pyarrow，未安装时返回 None"""
+    try:
+        import pyarrow
+        import pyarrow.csv
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+class _PandasCsvSink:
+    """未安装 pyarrow 时用 pandas 分块写入 csv"""
+
+    def __init__(self, path, header):
+        self.header = header
+        self.file = open(path, 'w', encoding='utf-8-sig', newline='')
+        pd.DataFrame(columns=header).to_csv(self.file, index=False)
+
+    def write(self, pending):
+        frame = pd.DataFrame(block_columns(self.header, pending), columns=self.header)
+        frame.to_csv(self.file, header=False, index=False)
+
+    def close(self):
+        self.file.close()
+
+
+class _ArrowSink:
+    """用 pyarrow 按批写入 csv / parquet / feather，各列类型固定：文本列为字符串，其余为整数或浮点数"""
+
+    def __init__(self, path, header, fmt, pa):
+        self.pa = pa
+        self.header = header
+        self.file = None
+        # Parquet 的文本列直接以字典形式写入；csv 和 Arrow IPC 文件需要先还原为字符串
+        self.decode_text = fmt != 'parquet'
+        fields = []
+        for name in header:
+            if name in TEXT_COLUMNS:
+                fields.append((name, pa.string() if self.decode_text else pa.dictionary(pa.int32(), pa.string())))
+            elif name in INTEGER_COLUMNS:
+                fields.append((name, pa.int64()))
+            else:
+                fields.append((name, pa.float64()))
+        self.schema = pa.schema(fields)
+        if fmt == 'parquet':
+            # 数值列几乎没有重复值，只对文本列使用字典编码
+            self.writer = pa.parquet.ParquetWriter(path, self.schema,
+                                                   use_dictionary=[name for name in header if name in TEXT_COLUMNS])
+        elif fmt == 'csv':
+            # 写入 BOM，Excel 直接打开时中文不乱码
+            self.file = open(path, 'wb')
+            self.file.write(codecs.BOM_UTF8)
+            self.writer = pa.csv.CSVWriter(self.file, self.schema)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression='lz4')
+            self.writer = pa.ipc.new_file(path, self.schema, options=options)
+
+    def write(self, pending):
+        pa = self.pa
+        arrays = []
+        columns = block_columns(self.header, pending)
+        for field in self.schema:
+            values = columns[field.name]
+            if field.name in TEXT_COLUMNS:
+                text = pa.array(values).cast(pa.dictionary(pa.int32(), pa.string()))
+                arrays.append(text.dictionary_decode() if self.decode_text else text)
+            else:
+                arrays.append(pa.array(values, from_pandas=True).cast(field.type))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+        if self.file is not None:
+            self.file.close()
+
+
+class TableFileWriter(ExportWriter):
+    """流式写入 CSV / Parquet / Feather 文件，每个工作表写为一个文件，按约 TABLE_EXPORT_ROWS 行一块追加
+
+    第一个工作表写入 file_path，其余写入 “文件名_工作表名.扩展名”。
+    文本列为字符串、其余列为数值，“未找到”“N/A”等占位写为空值，便于 pandas 等直接读取。
+    Parquet/Feather 需要 pyarrow；csv 在未安装 pyarrow 时用 pandas 写入（较慢）。
+    """
+
+    def __init__(self, file_path, fmt, total_rows=0, progress=None, stop_event=None):
+        super().__init__(total_rows, progress, stop_event)
+        self.file_path = file_path
+        self.fmt = fmt
+        self.paths = []
+        self.pa = import_pyarrow()
+        if self.pa is None and fmt != 'csv':
+            raise ValueError("导出 Parquet/Feather 需要安装 pyarrow")
+
+    def write_blocks(self, title, header, blocks):
+        if self.paths:
+            stem, ext = os.path.splitext(self.file_path)
+            path = f'{stem}_{title}{ext}'
+        else:
+            path = self.file_path
+        self.paths.append(path)
+        if self.pa is None:
+            sink = _PandasCsvSink(path, header)
+        else:
+            sink = _ArrowSink(path, header, self.fmt, self.pa)
+        cancelled = False
+        try:
+            pending = []
+            size = 0
+            for count, columns in blocks:
+                pending.append((count, columns))
+                size += count
+                self._advance(count)
+                if size >= TABLE_EXPORT_ROWS:
+                    sink.write(pending)
+                    pending = []
+                    size = 0
+            if pending or size == 0:
+                sink.write(pending)
+        except ExportCancelled:
+            cancelled = True
+            raise
+        finally:
+            sink.close()
+            if cancelled:
+                self._remove_files()
+
+    def _remove_files(self):
+        for path in self.paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _cancel(self):
+        """删除已写入的文件后抛出 ExportCancelled"""
+        self._remove_files()
+        raise ExportCancelled()
+
+
+def cell_values(values):
+    """数组转换为单元格值列表，NaN 写为空单元格"""
+    cells = values.tolist()
+    if np.isnan(values).any():
+        if values.ndim == 1:
+            return [None if v != v else v for v in cells]
+        return [[None if v != v else v for v in row] for row in cells]
+    return cells
+
+
+# 导出布局。数据预览工作表每列为 (表头, 找到记录时的内容, 未找到时的内容)，统计工作表每项为 (字段名, 内容)
+# 或 (数值序号, 字段名前缀)，后者展开为该数值的统计字段，数值序号为 None 时每个数值一行。
+# 内容：'name' 不含扩展名的文件名、'file' 文件名（重名时为相对路径，见 file_labels）、'label' 查询名称、'index' 序号（未找到时为 1）、'count' 记录数、
+# 'column' 数值序号（未找到时为 N/A）、'corr' 相关系数，整数 j 为第 j 个数值（未找到时为“未找到”），None 为空。
+# 表头和前缀中的 {label}、{key}、{n} 为该数值的名称、所属关键词和序号。
+# 模式 1~4 沿用原有的工作表布局，多关键词和模板提取使用通用布局，数值列按查询展开（见 value_layout）
+LEGACY_LAYOUTS = {
+    1: ('数据预览', [('角度', 'name', 'name'), ('个数', 'index', None), ('{label}', 0, 0), ('值的个数', None, 'count'),
+                    ('序号', None, 'index')]),
+    2: ('数值数据', [('角度', 'name', None), ('个数', 'index', None), ('{label}', 0, 0), ('{label}', 1, 1),
+                    ('文件名', None, 'name'), ('值的组数', None, 'count'), ('序号', None, 'index')]),
+    3: ('数据预览', [('角度', 'name', None), ('个数', 'count', None), ('序号', 'index', 'index'), ('{label}', 0, 0),
+                    ('{label}', 1, 1), ('文件名', None, 'name'), ('匹配行数', None, 'count')]),
+    # 三值只导出第三个值
+    4: ('数值数据', [('角度', 'file', None), ('序号', 'index', 'index'), ('{label}', 2, 2), ('文件名', None, 'file'),
+                    ('值的组数', None, 'count'), ('{label}', None, 0), ('{label}', None, 1)]),
+}
+VALUE_COLUMNS = [('角度', 'name', 'name'), ('关键词', 'label', 'label'), ('序号', 'index', 'index')]
+# (工作表名, 是否包含差值, 找到记录时的字段, 未找到时的字段)
+LEGACY_STATISTICS = {
+    1: ('数据处理', True, [('角度', 'name'), ('个数', 'count'), (0, '')],
+        [('文件名', 'name'), ('值的个数', 'count'), (0, '')]),
+    2: ('双数值统计', False, [('角度', 'name'), ('个数', 'count'), (0, '值1'), (1, '值2')],
+        [('文件名', 'name'), ('值的组数', 'count'), (0, '值1'), (1, '值2')]),
+    3: ('数据统计', False, [('角度', 'name'), ('个数', 'count'), (0, '{key}'), (1, '{key}'), ('相关系数', 'corr')],
+        [('文件名', 'name'), ('个数', 'count'), (0, '{key}'), (1, '{key}'), ('相关系数', 'corr')]),
+    # 三值只统计第三个值
+    4: ('数值统计', False, [('角度', 'name'), ('个数', 'count'), (2, '值3')],
+        [('文件名', 'name'), ('个数', 'count'), (0, '{label}'), (1, '{label}'), (2, '{label}')]),
+}
+STATISTICS_LAYOUT = ('数据处理', True,
+                     [('角度', 'name'), ('关键词', 'label'), ('值序号', 'column'), ('个数', 'count'), (None, '')],
+                     [('角度', 'name'), ('关键词', 'label'), ('值序号', 'column'), ('个数', 'count'), (None, '')])
+
+
+def value_layout(queries):
+    """多关键词和模板提取的数据预览布局：只有一个查询时数值列以模板中的名称为表头，否则为 值1、值2…"""
+    width = max(query_columns(query) for query in queries)
+    name = '{label}' if len(queries) == 1 else '值{n}'
+    return '数据预览', VALUE_COLUMNS + [(name, j, 0 if j == 0 else None) for j in range(width)]
+
+
+def layout_name(text, template, j):
+    """布局中的表头或字段名前缀，{label}、{key}、{n} 替换为模板中第 j 个数值的名称、所属关键词和序号"""
+    if j >= template.columns:
+        return text.format(n=j + 1, label='', key='')
+    return text.format(n=j + 1, label=template.labels[j], key=template.keys[j])
+
+
+def export_values(writer, store, queries, layout):
+    """按布局写入数据预览工作表，每个文件的每个查询一块：找到记录时每条记录一行，未找到时一行"""
+    title, columns = layout
+    template = query_template(queries[0])
+    # 数值列的表头取该列数值的名称
+    header = [layout_name(name, template, next((j for j in (found, empty) if isinstance(j, int)), 0))
+              for name, found, empty in columns]
+
+    names = dict(zip(store.paths, file_labels(store.paths, extension=False)))
+    file_names = dict(zip(store.paths, file_labels(store.paths)))
+
+    def blocks():
+        for file_path, results in store.items():
+            for query, values in zip(queries, results):
+                count = len(values)
+                fields = {'name': names[file_path], 'file': file_names[file_path], 'label': query_label(query),
+                          'count': count}
+                if count == 0:
+                    fields['index'] = 1
+                    yield 1, ['未找到' if isinstance(empty, int) else fields.get(empty) for _, _, empty in columns]
+                    continue
+
+                fields['index'] = np.arange(1, count + 1)
+                if values.ndim == 1:
+                    values = values[:, None]
+                yield count, [(values[:, found] if found < values.shape[1] else None) if isinstance(found, int)
+                              else fields.get(found) for _, found, _ in columns]
+
+    writer.write_blocks(title, header, blocks())
+
+
+def export_statistics(writer, store, queries, layout):
+    """按布局写入统计工作表，每个文件的每个查询一行（数值序号为 None 时每个数值一行）"""
+    title, spread, found, empty = layout
+    correlation = any(value == 'corr' for _, value in found + empty)
+    templates = [query_template(query) for query in queries]
+    summaries = [store.statistics(i, correlation=correlation) for i in range(len(queries))]
+    names = file_labels(store.paths, extension=False)
+    file_names = file_labels(store.paths)
+    records = []
+    for n in range(len(store.paths)):
+        for query, template, summary in zip(queries, templates, summaries):
+            count = int(summary['count'][n])
+            items = found if count else empty
+            expand = count and any(key is None for key, _ in items)
+            for column in (range(template.columns) if expand else [None]):
+                fields = {'name': names[n], 'file': file_names[n], 'label': query_label(query),
+                          'count': count, 'column': 'N/A' if column is None else column + 1,
+                          'corr': summary['corr'][n] if correlation and count > 1 else 'N/A'}
+                record = {}
+                for key, value in items:
+                    if isinstance(key, str):
+                        record[key] = fields[value]
+                        continue
+                    j = (column or 0) if key is None else key
+                    record.update(stat_fields(summary, n, j, layout_name(value, template, j), spread))
+                records.append(record)
+
+    writer.write_records(title, records)
+
+
+def stat_fields(stats, n, j=0, prefix='', spread=False):
+    """group_statistics 结果中第 n 组第 j 列的统计字段，字段名以 prefix 开头，没有记录的组为 N/A
+
+    spread 为 True 时包含差值，百分位数字段名为 P5、P50、P95 等。
+    """
+    names = ['最小值', '最大值'] + (['差值'] if spread else []) + ['平均值', '标准差']
+    names += [f'P{q}' for q in STAT_PERCENTILES]
+    if stats['count'][n] == 0:
+        return {prefix + name: 'N/A' for name in names}
+
+    values = [stats['min'][n, j], stats['max'][n, j]]
+    if spread:
+        values.append(stats['range'][n, j])
+    values += [stats['mean'][n, j], stats['std'][n, j]]
+    values += list(stats['percentiles'][:, n, j])
+    return {prefix + name: value for name, value in zip(names, values)}
+
+
+def export_results(file_path, mode, store, queries, statistics=False, progress=None, stop_event=None):
+    """将 ResultStore 中的提取结果流式写入文件，statistics 为 True 时附加数据处理工作表
+
+    格式由扩展名决定：xlsx 写为一个工作簿，csv/parquet/feather(arrow) 每个工作表写为一个文件。
+    progress(已写入行数, 预计总行数) 用于报告进度；stop_event 被设置后抛出 ExportCancelled，不保留文件。
+    store 未保存原始数值（keep_values 为 False）时只导出数据处理工作表。
+    """
+    fmt = EXPORT_FORMATS.get(os.path.splitext(file_path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"不支持的导出格式: {os.path.splitext(file_path)[1]}")
+    total_rows = sum(len(store.values(i)) for i in range(len(queries))) + len(store) * len(queries)
+    if fmt == 'xlsx':
+        writer = ExcelStreamWriter(file_path, total_rows, progress, stop_event)
+    else:
+        writer = TableFileWriter(file_path, fmt, total_rows, progress, stop_event)
+    if not store.keep_values:
+        statistics = True
+    else:
+        export_values(writer, store, queries, LEGACY_LAYOUTS.get(mode) or value_layout(queries))
+    if statistics:
+        export_statistics(writer, store, queries, LEGACY_STATISTICS.get(mode, STATISTICS_LAYOUT))
+
+    writer.save()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="从 dat/txt/log/xlsx 文件中批量提取关键词后的数值")
+    parser.add_argument("paths", nargs="+", help="文件、文件夹或通配符（如 \"logs/**/*.log\"）")
+    parser.add_argument("-k", "--keyword", default="", help="关键词1")
+    parser.add_argument("-k2", "--keyword2", default="", help="关键词2（双关键词值提取）")
+    parser.add_argument("-m", "--mode", type=int, choices=(1, 2, 3, 4), default=1,
+                        help="1 单值，2 双值，3 双关键词值，4 三值")
+    parser.add_argument("-q", "--queries", default="",
+                        help="多关键词列表，如 \"A; B*2; C*3; D&E; F {n} ... G {n}\"，指定后忽略 -k/-m/-t")
+    parser.add_argument("-t", "--template", default="",
+                        help="数值模板，{n} 为数值、... 为间隔，如 \"Angle {n} ... Power {n} {n} {n}\"，指定后忽略 -k/-m")
+    parser.add_argument("-o", "--output", required=True,
+                        help="输出文件，扩展名决定格式：xlsx、csv、parquet、feather")
+    parser.add_argument("-e", "--ext", default="dat", help="文件类型，逗号分隔，默认 dat")
+    parser.add_argument("-s", "--stats", action="store_true", help="同时导出数据处理（统计）工作表")
+    parser.add_argument("--stats-only", action="store_true",
+                        help="只导出数据处理（统计）工作表，提取时只累计统计量、不保存原始数值，百分位数为近似值")
+    parser.add_argument("-c", "--columns", action="store_true", help="xlsx/csv 文件按列提取，关键词作为表头名称")
+    parser.add_argument("--pairing", default=DEFAULT_PAIRING,
+                        help="关键词1与其后数值（双值、三值）或关键词2（双关键词值）的配对规则：next 最近的（默认）、"
+                             "line 同一行、lines:N 之后 N 行以内、bytes:N 之后 N 字节以内、block 同一记录块（以空行分隔）、"
+                             "tokens:N 之后 N 个词以内")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="并行进程数")
+    parser.add_argument("--buffer-mb", type=int, default=DEFAULT_BUFFER_SIZE // (1024 * 1024), help="读取缓冲区(MB)")
+    parser.add_argument("--cache", default="", help="结果缓存文件（SQLite），未修改的文件直接读取缓存")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_CACHE_MAX_BYTES // (1024 * 1024),
+                        help="结果缓存容量上限(MB)")
+    parser.add_argument("--clear-cache", action="store_true", help="提取前清空结果缓存")
+    parser.add_argument("--perf", default="", help="性能报告文件（.json 或 .csv），记录各阶段及每个文件的耗时")
+    parser.add_argument("--cprofile", action="store_true", help="性能报告中附加 cProfile 结果（需要 --perf）")
+    parser.add_argument("--tracemalloc", action="store_true", help="性能报告中附加 tracemalloc 内存分配结果（需要 --perf）")
+    args = parser.parse_args(argv)
+
+    if args.queries:
+        mode = 5
+        try:
+            queries = parse_query_list(args.queries)
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.template:
+        mode = TEMPLATE_MODE
+        try:
+            queries = [(mode, ValueTemplate.parse(args.template).text, "")]
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        mode = args.mode
+        queries = [(mode, args.keyword, args.keyword2)] if args.keyword else []
+        if mode == 3 and not args.keyword2:
+            parser.error("双关键词值提取需要 --keyword2")
+    if not queries:
+        parser.error("请指定 --keyword、--template 或 --queries")
+    if os.path.splitext(args.output)[1].lower() not in EXPORT_FORMATS:
+        parser.error("输出文件扩展名须为 " + "、".join(EXPORT_FORMATS))
+    if (args.cprofile or args.tracemalloc) and not args.perf:
+        parser.error("--cprofile / --tracemalloc 需要同时指定 --perf")
+    try:
+        parse_pairing(args.pairing)
+    except ValueError as e:
+        parser.error(str(e))
+
+    exts = [e.strip().lower().lstrip('.') for e in args.ext.split(',') if e.strip()]
+    files = sort_files_by_numeric_value(collect_paths(args.paths, exts))
+    if not files:
+        print(f"未找到符合条件的文件 ({', '.join(exts)})", file=sys.stderr)
+        return 1
+
+    cache = None
+    if args.cache:
+        cache = ResultCache(args.cache, max(1, args.cache_max_mb) * 1024 * 1024)
+        if args.clear_cache:
+            cache.clear()
+
+    data = ResultStore(queries, keep_values=not args.stats_only)
+    failed = 0
+    buffer_size = max(1, args.buffer_mb) * 1024 * 1024
+    perf = PerfRecorder() if args.perf else None
+    with perf.capture(args.cprofile, args.tracemalloc) if perf is not None else contextlib.nullcontext():
+        for file_path, results, error in iter_extract(files, queries, buffer_size, args.workers, exts, cache=cache,
+                                                      tabular=args.columns, perf=perf, pairing=args.pairing):
+            if error is not None:
+                failed += 1
+                print(f"处理文件 {os.path.basename(file_path)} 时出错: {error}", file=sys.stderr)
+                continue
+            start = time.perf_counter()
+            data.add(file_path, results)
+            if perf is not None:
+                perf.add('store', time.perf_counter() - start)
+
+        if cache is not None:
+            cache.close()
+
+        start = time.perf_counter()
+        export_results(args.output, mode, data, queries, statistics=args.stats)
+        if perf is not None:
+            size = os.path.getsize(args.output) if os.path.isfile(args.output) else 0
+            perf.add('export', time.perf_counter() - start, size)
+    valid_files = np.count_nonzero(data.file_counts())
+    print(f"处理 {len(files)} 个文件，成功 {valid_files} 个，出错 {failed} 个，结果已导出到 {args.output}")
+
+    if perf is not None:
+        perf.finish()
+        perf.export(args.perf)
+        report = perf.report(5)
+        print(f"总耗时 {report['wall_seconds']:.3f} 秒，性能报告已写入 {args.perf}", file=sys.stderr)
+        for stage in report['stages']:
+            print(f"  {stage['name']:<8} {stage['seconds']:9.3f} 秒 {stage['share']:7.1%}", file=sys.stderr)
+        for record in report['files']:
+            print(f"  {record['seconds']:9.3f} 秒  {record['file']}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,49 @@
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 import os
-import re
 import pandas as pd
 import numpy as np
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
 from matplotlib.figure import Figure
 import threading
 import queue
-import time
 import json
 import os.path
+import multiprocessing
+import time
+import contextlib
+from collections import deque
+
+from extract_core import (DEFAULT_BUFFER_SIZE, DEFAULT_PAIRING, PAIRING_RULES, PERF_SLOWEST, PERF_STAGES, TEMPLATE_MODE,
+                          ResultCache, ResultStore, TailFollower, ExportCancelled, PerfRecorder, ValueTemplate,
+                          file_labels, parse_query_list, query_columns, query_label, query_template, iter_extract,
+                          extract_numeric_value, sort_files_by_numeric_value, export_results)
+
+CACHE_FILE = "extract_cache.db"
+# 各提取模式的名称，用于状态栏和提示
+MODE_NAMES = {1: "单文本单值提取", 2: "单文本双值提取", 3: "双文本关联值提取", 4: "单文本三值提取", 5: "多关键词提取",
+              TEMPLATE_MODE: "模板提取"}
+# 图表中最多显示的直方图子图个数
+CHART_MAX_PLOTS = 6
+# 跟踪模式下两次增量提取之间的间隔（毫秒）
+TAIL_INTERVAL_MS = 2000
+# 后台线程发送结果行的批大小上限及最长间隔（秒）
+ROW_BATCH_MAX = 500
+ROW_FLUSH_INTERVAL = 0.05
+# 主线程每次刷新写入结果列表的时间预算（秒）及每批的最少行数
+ROW_FRAME_BUDGET = 0.03
+ROW_BATCH_MIN = 50
+# 提取过程中刷新实时统计的最短间隔（秒）
+STATS_REFRESH_INTERVAL = 0.5
+# 直方图显示的桶数；关联值不超过 CHART_SCATTER_MAX 个时画散点图，否则画密度图；提取过程中刷新图表的最短间隔（秒）
+CHART_BINS = 20
+CHART_SCATTER_MAX = 5000
+CHART_REFRESH_INTERVAL = 1.0
+# 图表分辨率及图表区域尚未显示时的默认大小（像素）
+CHART_DPI = 100
+CHART_DEFAULT_SIZE = (800, 600)
 
 
 class DatFileExtractor:
@@ -26,16 +58,48 @@ class DatFileExtractor:
 
         self.selected_files = []
         self.file_checkboxes = {}
-        self.extracted_single = {}
-        self.extracted_double = {}
-        self.extracted_dual = {}
-        self.extracted_triple = {}
+        self.results = ResultStore([])
+        self.result_mode = None
         self.search_text1 = ""
         self.search_text2 = ""
+        self.queries = []
         self.status_queue = queue.Queue()
         self.process_data = tk.BooleanVar(value=False)
         self.extract_mode = tk.IntVar(value=1)
         self.stop_extraction = threading.Event()
+        self.stop_export = threading.Event()
+        self.export_thread = None
+        self.buffer_size_mb = tk.IntVar(value=DEFAULT_BUFFER_SIZE // (1024 * 1024))
+        self.buffer_size = DEFAULT_BUFFER_SIZE
+        self.worker_count_var = tk.IntVar(value=1)
+        self.worker_count = 1
+        self.supported_exts = []
+        self.use_cache = tk.BooleanVar(value=True)
+        self.cache = None
+        self.tail_mode = tk.BooleanVar(value=False)
+        self.table_mode = tk.BooleanVar(value=False)
+        self.tabular = False
+        self.pairing_rule = tk.StringVar(value=PAIRING_RULES[DEFAULT_PAIRING])
+        self.pairing_limit = tk.IntVar(value=1)
+        self.pairing = DEFAULT_PAIRING
+        self.tail_follower = None
+        self.tail_files = []
+        self.tail_generation = 0
+        self.tail_lock = threading.Lock()
+        self.result_items = {}
+        self.row_labels = {}
+        self.result_cells = {}
+        self.pending_rows = deque()
+        self.row_batch = ROW_BATCH_MIN
+        self.stats_dirty = False
+        self.stats_refreshed = 0.0
+        self.chart_size = CHART_DEFAULT_SIZE
+        self.chart_requested = threading.Event()
+        self.chart_image = None
+        self.perf_enabled = tk.BooleanVar(value=False)
+        self.perf_capture = tk.BooleanVar(value=False)
+        self.perf = None
+        self.perf_profile = False
 
         # 关键词历史记录
         self.keyword_history1 = []
@@ -59,6 +123,7 @@ class DatFileExtractor:
         self.drag_data = {'item': None, 'x': 0, 'y': 0}
 
         self.create_widgets()
+        threading.Thread(target=self._chart_render_loop, daemon=True).start()
         self.root.after(100, self.update_status)
 
     def load_keyword_history(self):
@@ -175,6 +240,29 @@ class DatFileExtractor:
         ttk.Button(btn_frame2, text="-", width=2, command=lambda: self.remove_keyword_from_history(2)).pack(
             side=tk.LEFT, padx=2)
 
+        # 双值、三值和双关键词值提取时关键词1与其后数值或关键词2的配对规则，N 用于"N 行/字节/个词以内"
+        ttk.Label(keyword2_frame, text="配对:").pack(side=tk.LEFT, padx=(5, 2))
+        ttk.Combobox(keyword2_frame, textvariable=self.pairing_rule, values=list(PAIRING_RULES.values()),
+                     state="readonly", width=12).pack(side=tk.LEFT)
+        ttk.Label(keyword2_frame, text="N:").pack(side=tk.LEFT, padx=(5, 2))
+        ttk.Spinbox(keyword2_frame, from_=0, to=1000000, textvariable=self.pairing_limit, width=6).pack(side=tk.LEFT)
+
+        multi_frame = ttk.Frame(search_frame)
+        multi_frame.pack(fill=tk.X, pady=(5, 0))
+
+        ttk.Label(multi_frame, text="多关键词:").pack(side=tk.LEFT, padx=5)
+        self.multi_entry = ttk.Entry(multi_frame, width=32)
+        self.multi_entry.pack(side=tk.LEFT, padx=5)
+        ttk.Label(multi_frame, text="(如: A; B*2; C*3; D&E)").pack(side=tk.LEFT)
+
+        template_frame = ttk.Frame(search_frame)
+        template_frame.pack(fill=tk.X, pady=(5, 0))
+
+        ttk.Label(template_frame, text="数值模板:").pack(side=tk.LEFT, padx=5)
+        self.template_entry = ttk.Entry(template_frame, width=32)
+        self.template_entry.pack(side=tk.LEFT, padx=5)
+        ttk.Label(template_frame, text="(如: Angle {n} ... Power {n} {n})").pack(side=tk.LEFT)
+
         mode_frame = ttk.Frame(extract_settings_frame, padding=(10, 0))
         mode_frame.grid(row=0, column=1, sticky=tk.W)
 
@@ -183,20 +271,47 @@ class DatFileExtractor:
         ttk.Radiobutton(mode_frame, text="提取三值", variable=self.extract_mode, value=4).pack(side=tk.LEFT, padx=5)
         ttk.Radiobutton(mode_frame, text="双关键词值提取", variable=self.extract_mode, value=3).pack(side=tk.LEFT,
                                                                                                      padx=5)
+        ttk.Radiobutton(mode_frame, text="多关键词提取", variable=self.extract_mode, value=5).pack(side=tk.LEFT,
+                                                                                                   padx=5)
+        ttk.Radiobutton(mode_frame, text="模板提取", variable=self.extract_mode, value=TEMPLATE_MODE).pack(
+            side=tk.LEFT, padx=5)
 
         btn_frame = ttk.Frame(extract_settings_frame, padding=(10, 0))
         btn_frame.grid(row=0, column=2, sticky=tk.E)
 
         ttk.Button(btn_frame, text="提取数据", command=self.extract_data, width=12).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="停止提取", command=self.stop_extraction_thread, width=12).pack(side=tk.LEFT, padx=5)
-        ttk.Button(btn_frame, text="导出Excel", command=self.export_to_excel, width=12).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="导出数据", command=self.export_to_excel, width=12).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="取消导出", command=self.cancel_export, width=12).pack(side=tk.LEFT, padx=5)
 
         process_frame = ttk.Frame(extract_settings_frame, padding=(10, 0))
         process_frame.grid(row=0, column=3, sticky=tk.W)
         ttk.Checkbutton(process_frame, text="数据处理", variable=self.process_data).pack(side=tk.LEFT, padx=5)
 
+        advanced_frame = ttk.Frame(extract_settings_frame)
+        advanced_frame.grid(row=1, column=0, columnspan=4, sticky=tk.W, padx=5)
+
+        ttk.Label(advanced_frame, text="读取缓冲区(MB):").pack(side=tk.LEFT, padx=5)
+        ttk.Spinbox(advanced_frame, from_=1, to=1024, textvariable=self.buffer_size_mb, width=6).pack(side=tk.LEFT)
+
+        ttk.Label(advanced_frame, text="并行进程数:").pack(side=tk.LEFT, padx=(15, 5))
+        ttk.Spinbox(advanced_frame, from_=1, to=max(1, os.cpu_count() or 1), textvariable=self.worker_count_var,
+                    width=4).pack(side=tk.LEFT)
+
+        ttk.Checkbutton(advanced_frame, text="使用缓存", variable=self.use_cache).pack(side=tk.LEFT, padx=(15, 5))
+        ttk.Button(advanced_frame, text="清除缓存", command=self.clear_cache).pack(side=tk.LEFT)
+
+        ttk.Checkbutton(advanced_frame, text="跟踪增长(增量提取)", variable=self.tail_mode).pack(side=tk.LEFT,
+                                                                                               padx=(15, 5))
+
+        ttk.Checkbutton(advanced_frame, text="xlsx/csv按列提取(关键词为表头)", variable=self.table_mode).pack(
+            side=tk.LEFT, padx=(15, 5))
+
+        ttk.Checkbutton(advanced_frame, text="性能记录", variable=self.perf_enabled).pack(side=tk.LEFT, padx=(15, 5))
+        ttk.Checkbutton(advanced_frame, text="cProfile/内存分析", variable=self.perf_capture).pack(side=tk.LEFT)
+
         progress_bar = ttk.Progressbar(extract_settings_frame, variable=self.progress_var, length=400)
-        progress_bar.grid(row=1, column=0, columnspan=4, sticky=tk.W + tk.E, padx=5, pady=5)
+        progress_bar.grid(row=2, column=0, columnspan=4, sticky=tk.W + tk.E, padx=5, pady=5)
 
         notebook = ttk.Notebook(main_frame)
         notebook.pack(fill=tk.BOTH, expand=True, pady=5)
@@ -255,20 +370,77 @@ class DatFileExtractor:
         self.results_tree.pack(fill=tk.BOTH, expand=True)
         results_scroll.config(command=self.results_tree.yview)
 
+        stats_tab = ttk.Frame(notebook)
+        notebook.add(stats_tab, text="实时统计")
+
+        stats_tree_frame = ttk.Frame(stats_tab)
+        stats_tree_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        self.stats_tree = ttk.Treeview(stats_tree_frame, show="headings")
+        self.stats_tree.pack(fill=tk.BOTH, expand=True)
+        stats_columns = ("keyword", "column", "count", "min", "max", "mean", "std", "p5", "p50", "p95")
+        stats_headings = ("关键词", "值序号", "个数", "最小值", "最大值", "平均值", "标准差", "P5", "P50", "P95")
+        self.stats_tree["columns"] = stats_columns
+        for column, heading in zip(stats_columns, stats_headings):
+            self.stats_tree.column(column, width=150 if column == "keyword" else 90, anchor=tk.E)
+            self.stats_tree.heading(column, text=heading)
+
         chart_tab = ttk.Frame(notebook)
         notebook.add(chart_tab, text="统计图表")
 
         chart_frame = ttk.Frame(chart_tab)
         chart_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
-        self.figure = Figure(figsize=(8, 6), dpi=100)
-        self.chart = FigureCanvasTkAgg(self.figure, chart_frame)
-        self.chart.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        # 图表由后台线程用 Agg 绘制为位图，这里只负责显示
+        self.figure = Figure(figsize=(CHART_DEFAULT_SIZE[0] / CHART_DPI, CHART_DEFAULT_SIZE[1] / CHART_DPI),
+                             dpi=CHART_DPI)
+        self.chart_canvas = tk.Canvas(chart_frame, highlightthickness=0)
+        self.chart_canvas.pack(fill=tk.BOTH, expand=True)
+        self.chart_canvas.bind("<Configure>", self.on_chart_resize)
+
+        perf_tab = ttk.Frame(notebook)
+        notebook.add(perf_tab, text="性能")
+
+        perf_btn_frame = ttk.Frame(perf_tab, padding=(5, 5, 5, 0))
+        perf_btn_frame.pack(fill=tk.X)
+        ttk.Button(perf_btn_frame, text="刷新", command=self._refresh_perf).pack(side=tk.LEFT)
+        ttk.Button(perf_btn_frame, text="导出报告", command=self.export_perf_report).pack(side=tk.LEFT, padx=5)
+        self.perf_summary_var = tk.StringVar(value="勾选“性能记录”后提取，这里显示各阶段耗时")
+        ttk.Label(perf_btn_frame, textvariable=self.perf_summary_var).pack(side=tk.LEFT, padx=10)
+
+        perf_panes = ttk.PanedWindow(perf_tab, orient=tk.VERTICAL)
+        perf_panes.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        self.perf_stage_tree = ttk.Treeview(perf_panes, show="headings", height=6)
+        stage_columns = ("stage", "seconds", "share", "size", "speed", "calls")
+        stage_headings = ("阶段", "耗时(秒)", "占比", "数据量(MB)", "速度(MB/s)", "次数")
+        self.perf_stage_tree["columns"] = stage_columns
+        for column, heading in zip(stage_columns, stage_headings):
+            self.perf_stage_tree.column(column, width=150 if column == "stage" else 100, anchor=tk.E)
+            self.perf_stage_tree.heading(column, text=heading)
+        perf_panes.add(self.perf_stage_tree, weight=1)
+
+        self.perf_file_tree = ttk.Treeview(perf_panes, height=6)
+        self.perf_file_tree["columns"] = ("seconds", "size", "speed", "slowest")
+        self.perf_file_tree.column("#0", width=350, minwidth=200)
+        self.perf_file_tree.heading("#0", text=f"最慢的 {PERF_SLOWEST} 个文件")
+        for column, heading in zip(("seconds", "size", "speed", "slowest"), ("耗时(秒)", "大小", "速度(MB/s)", "最慢阶段")):
+            self.perf_file_tree.column(column, width=120, anchor=tk.E)
+            self.perf_file_tree.heading(column, text=heading)
+        perf_panes.add(self.perf_file_tree, weight=1)
+
+        self.perf_text = tk.Text(perf_panes, height=8, wrap=tk.NONE, font=("Courier New", 9))
+        perf_panes.add(self.perf_text, weight=1)
 
         self.status_var = tk.StringVar()
         self.status_var.set("就绪")
-        status_bar = ttk.Label(main_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
-        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.summary_var = tk.StringVar()
+        status_frame = ttk.Frame(main_frame)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        summary_bar = ttk.Label(status_frame, textvariable=self.summary_var, relief=tk.SUNKEN, anchor=tk.E)
+        summary_bar.pack(side=tk.RIGHT)
+        status_bar = ttk.Label(status_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
     def add_keyword_to_history(self, keyword_num):
         """将当前关键词添加到历史记录"""
@@ -314,10 +486,114 @@ class DatFileExtractor:
                     self.status_var.set(msg)
                     messagebox.showerror("错误", msg)
                 elif msg_type == "chart":
-                    self.chart.draw()
+                    width, height, data = msg
+                    self.chart_image = tk.PhotoImage(width=width, height=height, data=data, format="PPM")
+                    self.chart_canvas.delete("all")
+                    self.chart_canvas.create_image(0, 0, image=self.chart_image, anchor=tk.NW)
+                elif msg_type == "export":
+                    self.status_var.set(f"数据已导出到 {msg}")
+                    messagebox.showinfo("成功", f"数据已成功导出到 {msg}")
+                elif msg_type == "tail":
+                    self.root.after(TAIL_INTERVAL_MS, self._tail_tick, msg)
+                elif msg_type == "perf":
+                    self._refresh_perf()
+                elif msg_type == "rows":
+                    generation, rows = msg
+                    if generation == self.tail_generation:
+                        self.pending_rows.extend(rows)
+                        self.stats_dirty = True
             except queue.Empty:
                 pass
-        self.root.after(100, self.update_status)
+        self._insert_pending_rows()
+        if self.stats_dirty and time.perf_counter() - self.stats_refreshed >= STATS_REFRESH_INTERVAL:
+            self._refresh_stats()
+        self.root.after(10 if self.pending_rows else 100, self.update_status)
+
+    def _insert_pending_rows(self):
+        """在主线程中批量写入结果行，每次最多占用 ROW_FRAME_BUDGET 秒，批大小按实测写入速度调整"""
+        start = time.perf_counter()
+        inserted = 0
+        while self.pending_rows and time.perf_counter() - start < ROW_FRAME_BUDGET:
+            for _ in range(min(self.row_batch, len(self.pending_rows))):
+                file_path, row = self.pending_rows.popleft()
+                item = self.result_items.get(file_path)
+                if item is None:
+                    self.result_items[file_path] = self.results_tree.insert(
+                        "", tk.END, text=self.row_labels.get(file_path, os.path.basename(file_path)), values=row)
+                else:
+                    self.results_tree.item(item, values=row)
+                inserted += 1
+        elapsed = time.perf_counter() - start
+        if inserted and self.perf is not None:
+            self.perf.add('insert', elapsed, calls=inserted)
+        if inserted and elapsed > 0:
+            # 一批约占时间预算的四分之一，既能及时检查预算又减少计时开销
+            self.row_batch = max(ROW_BATCH_MIN, int(inserted / elapsed * ROW_FRAME_BUDGET / 4))
+
+    def _refresh_stats(self):
+        """用结果集的流式统计刷新实时统计页和状态栏右侧的摘要，不重新扫描已保存的数值"""
+        self.stats_dirty = False
+        self.stats_refreshed = time.perf_counter()
+        self.stats_tree.delete(*self.stats_tree.get_children())
+        for i, query in enumerate(self.results.queries):
+            summary = self.results.summary(i)
+            std = summary.std()
+            quantiles = summary.quantiles()
+            for j in range(summary.width):
+                if summary.count == 0:
+                    cells = ("-",) * 7
+                else:
+                    cells = tuple(f"{v:.4f}" for v in (summary.minimum[j], summary.maximum[j], summary.mean[j],
+                                                         std[j], *quantiles[:, j]))
+                self.stats_tree.insert("", tk.END, values=(query_label(query), j + 1, summary.count) + cells)
+
+        if not self.results.queries or self.results.summary(0).count == 0:
+            self.summary_var.set("")
+            return
+        summary = self.results.summary(0)
+        self.summary_var.set(f"{summary.count} 个值  平均值 {summary.mean[0]:.4f}  标准差 {summary.std()[0]:.4f}")
+
+    def _refresh_perf(self):
+        """用当前的性能记录刷新性能页：各阶段合计、最慢的文件及 cProfile / tracemalloc 结果"""
+        if self.perf is None:
+            return
+        report = self.perf.report(PERF_SLOWEST)
+        self.perf_summary_var.set(f"总耗时 {report['wall_seconds']:.3f} 秒，{report['file_count']} 个文件")
+
+        self.perf_stage_tree.delete(*self.perf_stage_tree.get_children())
+        for stage in report['stages']:
+            speed = f"{stage['mb_per_s']:.1f}" if stage['mb_per_s'] else "-"
+            self.perf_stage_tree.insert("", tk.END, values=(
+                stage['name'], f"{stage['seconds']:.3f}", f"{stage['share']:.1%}",
+                f"{stage['bytes'] / (1024 * 1024):.1f}", speed, stage['calls']))
+
+        self.perf_file_tree.delete(*self.perf_file_tree.get_children())
+        for record in report['files']:
+            speed = record['bytes'] / (1024 * 1024) / record['seconds'] if record['seconds'] else 0
+            stages = record['stages']
+            slowest = max(stages, key=lambda stage: stages[stage]['seconds']) if stages else None
+            self.perf_file_tree.insert("", tk.END, text=os.path.basename(record['file']), values=(
+                f"{record['seconds']:.3f}", self.format_size(record['bytes']), f"{speed:.1f}" if speed else "-",
+                PERF_STAGES.get(slowest, "-")))
+
+        self.perf_text.delete("1.0", tk.END)
+        self.perf_text.insert(tk.END, "\n\n".join(text for text in (report['profile'], report['memory']) if text))
+
+    def export_perf_report(self):
+        if self.perf is None:
+            messagebox.showwarning("警告", "没有性能记录，请勾选“性能记录”后重新提取")
+            return
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("CSV files", "*.csv")]
+        )
+        if not file_path:
+            return
+        try:
+            self.perf.export(file_path)
+            self.status_var.set(f"性能报告已导出到 {file_path}")
+        except Exception as e:
+            messagebox.showerror("错误", f"导出性能报告失败: {str(e)}")
 
     # 新的拖动功能实现
     def on_press(self, event):
@@ -498,8 +774,9 @@ class DatFileExtractor:
                 valid_files.append(file_path)
 
         # 初始按文件名中的数字排序
-        self.selected_files = self._sort_files_by_numeric_value(valid_files)
+        self.selected_files = sort_files_by_numeric_value(valid_files)
 
+        labels = file_labels(self.selected_files)
         try:
             for i, file_path in enumerate(self.selected_files):
                 file_name = os.path.basename(file_path)
@@ -507,11 +784,11 @@ class DatFileExtractor:
                 size = self.format_size(file_stats.st_size)
                 modified = pd.to_datetime(file_stats.st_mtime, unit='s').strftime('%Y-%m-%d %H:%M:%S')
 
-                value = self._extract_numeric_value(file_name)
+                value = extract_numeric_value(file_name)
                 order_str = f"{value}" if value is not None else "-"
 
                 check_status = "✓" if self.select_all_var.get() else " "
-                item_id = self.files_tree.insert("", tk.END, text=file_name,
+                item_id = self.files_tree.insert("", tk.END, text=labels[i],
                                                  values=(check_status, size, modified, order_str))
 
                 self.file_checkboxes[item_id] = {
@@ -527,23 +804,6 @@ class DatFileExtractor:
             messagebox.showerror("错误", f"读取文件时出错: {str(e)}")
             self.status_var.set("读取文件时出错")
 
-    def _extract_numeric_value(self, filename):
-        try:
-            match = re.search(r'(-?\d+\.?\d*)', filename)
-            if match:
-                return float(match.group(1))
-            return None
-        except:
-            return None
-
-    def _sort_files_by_numeric_value(self, files):
-        def get_numeric_value(file_path):
-            filename = os.path.basename(file_path)
-            value = self._extract_numeric_value(filename)
-            return value if value is not None else float('inf')
-
-        return sorted(files, key=get_numeric_value)
-
     def format_size(self, size_bytes):
         units = ['B', 'KB', 'MB', 'GB', 'TB']
         unit_index = 0
@@ -587,6 +847,37 @@ class DatFileExtractor:
                 checked_files.append(self.file_checkboxes[item]['path'])
         return checked_files
 
+    def get_cache(self):
+        """打开结果缓存，失败时返回 None 并关闭缓存"""
+        if self.cache is None:
+            try:
+                self.cache = ResultCache(CACHE_FILE)
+            except Exception as e:
+                self.use_cache.set(False)
+                self.status_var.set(f"无法打开缓存: {str(e)}")
+        return self.cache
+
+    def clear_cache(self):
+        cache = self.get_cache()
+        if cache is None:
+            return
+        try:
+            cache.clear()
+            self.status_var.set("缓存已清除")
+        except Exception as e:
+            messagebox.showerror("错误", f"清除缓存失败: {str(e)}")
+
+    def get_pairing(self):
+        """界面上选择的配对规则，如 next、lines:3"""
+        kind = next((k for k, label in PAIRING_RULES.items() if label == self.pairing_rule.get()), DEFAULT_PAIRING)
+        if kind not in ('lines', 'bytes', 'tokens'):
+            return kind
+        try:
+            limit = max(0, self.pairing_limit.get())
+        except tk.TclError:
+            limit = 0
+        return f"{kind}:{limit}"
+
     def stop_extraction_thread(self):
         self.stop_extraction.set()
         self.status_var.set("正在停止提取...")
@@ -625,619 +916,444 @@ class DatFileExtractor:
             messagebox.showwarning("警告", "请输入搜索文本1")
             return
 
+        mode = self.extract_mode.get()
+        if mode == 5:
+            try:
+                self.queries = parse_query_list(self.multi_entry.get())
+            except ValueError as e:
+                messagebox.showwarning("警告", f"多关键词列表中的模板有误: {str(e)}")
+                return
+            if not self.queries:
+                messagebox.showwarning("警告", "请输入多关键词列表")
+                return
+        elif mode == TEMPLATE_MODE:
+            if not self.template_entry.get().strip():
+                messagebox.showwarning("警告", "请输入数值模板")
+                return
+            try:
+                self.queries = [(mode, ValueTemplate.parse(self.template_entry.get()).text, "")]
+            except ValueError as e:
+                messagebox.showwarning("警告", f"数值模板有误: {str(e)}")
+                return
+        else:
+            self.queries = [(mode, self.search_text1, self.search_text2)]
+
         checked_files = self.get_checked_files()
         if not checked_files:
             messagebox.showwarning("警告", "请至少选择一个文件")
             return
+        # 结果中的文件名称，重名的文件显示相对路径
+        self.row_labels = dict(zip(checked_files, file_labels(checked_files)))
+
+        # 每次提取重新开始记录，关闭时不做任何计时
+        self.perf = PerfRecorder() if self.perf_enabled.get() else None
+        self.perf_profile = self.perf_capture.get()
+
+        # 跟踪模式下关键词未变时只提取新追加的内容
+        pairing = self.get_pairing()
+        incremental = (self.tail_mode.get() and self.tail_follower is not None
+                       and self.tail_follower.queries == self.queries
+                       and self.tail_follower.tabular == self.table_mode.get()
+                       and self.tail_follower.pairing == pairing)
+        if incremental:
+            for file_path, item in self.result_items.items():
+                self.results_tree.item(item, text=self.row_labels.get(file_path, os.path.basename(file_path)))
+            self.tail_files = checked_files
+            self.tail_generation += 1
+            self.status_var.set("正在增量提取数据...")
+            threading.Thread(target=self._tail_thread, args=(checked_files, self.tail_generation, False),
+                             daemon=True).start()
+            return
 
         for item in self.results_tree.get_children():
             self.results_tree.delete(item)
-        self.extracted_single.clear()
-        self.extracted_double.clear()
-        self.extracted_dual.clear()
-        self.extracted_triple.clear()
-
-        if self.extract_mode.get() == 1:
-            self.results_tree["columns"] = ("value", "count")
-            self.results_tree.column("#0", width=400, minwidth=250)
-            self.results_tree.column("value", width=250, minwidth=150, anchor=tk.E)
-            self.results_tree.column("count", width=100, minwidth=80, anchor=tk.CENTER)
-            self.results_tree.heading("#0", text="文件名")
-            self.results_tree.heading("value", text=f"{self.search_text1}值")
-            self.results_tree.heading("count", text="值的个数")
-        elif self.extract_mode.get() == 2:
-            self.results_tree["columns"] = ("value1", "value2", "count")
-            self.results_tree.column("#0", width=350, minwidth=200)
-            self.results_tree.column("value1", width=200, minwidth=150, anchor=tk.E)
-            self.results_tree.column("value2", width=200, minwidth=150, anchor=tk.E)
-            self.results_tree.column("count", width=100, minwidth=80, anchor=tk.CENTER)
+        self.result_items.clear()
+        self.result_cells.clear()
+        self.pending_rows.clear()
+        self.results = ResultStore(self.queries)
+        self.stats_dirty = True
+        self.result_mode = self.extract_mode.get()
+
+        if self.result_mode != 5:
+            # 单个查询：每个数值一列，表头为模板中数值的名称（如 Angle值、Power值1）
+            labels = query_template(self.queries[0]).labels
+            columns = tuple(f"value{j}" for j in range(1, len(labels) + 1))
+            self.results_tree["columns"] = columns + ("count",)
+            self.results_tree.column("#0", width=max(300, 450 - 50 * len(labels)),
+                                     minwidth=max(150, 300 - 50 * len(labels)))
             self.results_tree.heading("#0", text="文件名")
-            self.results_tree.heading("value1", text=f"{self.search_text1}值1")
-            self.results_tree.heading("value2", text=f"{self.search_text1}值2")
-            self.results_tree.heading("count", text="个数")
-        elif self.extract_mode.get() == 3:
-            self.results_tree["columns"] = ("value1", "value2", "count")
-            self.results_tree.column("#0", width=350, minwidth=200)
-            self.results_tree.column("value1", width=200, minwidth=150, anchor=tk.E)
-            self.results_tree.column("value2", width=200, minwidth=150, anchor=tk.E)
+            for column, label in zip(columns, labels):
+                self.results_tree.column(column, width=max(100, 300 - 50 * len(labels)),
+                                         minwidth=150 if len(labels) < 3 else 100, anchor=tk.E)
+                self.results_tree.heading(column, text=label)
             self.results_tree.column("count", width=100, minwidth=80, anchor=tk.CENTER)
-            self.results_tree.heading("#0", text="文件名")
-            self.results_tree.heading("value1", text=f"{self.search_text1}值")
-            self.results_tree.heading("value2", text=f"{self.search_text2}值")
-            self.results_tree.heading("count", text="个数")
+            self.results_tree.heading("count", text="值的个数" if len(labels) == 1 else "个数")
         else:
-            self.results_tree["columns"] = ("value1", "value2", "value3", "count")
+            columns = tuple(f"q{i}" for i in range(len(self.queries)))
+            self.results_tree["columns"] = columns + ("count",)
             self.results_tree.column("#0", width=300, minwidth=150)
-            self.results_tree.column("value1", width=150, minwidth=100, anchor=tk.E)
-            self.results_tree.column("value2", width=150, minwidth=100, anchor=tk.E)
-            self.results_tree.column("value3", width=150, minwidth=100, anchor=tk.E)
-            self.results_tree.column("count", width=100, minwidth=80, anchor=tk.CENTER)
             self.results_tree.heading("#0", text="文件名")
-            self.results_tree.heading("value1", text=f"{self.search_text1}值1")
-            self.results_tree.heading("value2", text=f"{self.search_text1}值2")
-            self.results_tree.heading("value3", text=f"{self.search_text1}值3")
+            for column, query in zip(columns, self.queries):
+                self.results_tree.column(column, width=150, minwidth=100, anchor=tk.E)
+                self.results_tree.heading(column, text=query_label(query))
+            self.results_tree.column("count", width=100, minwidth=80, anchor=tk.CENTER)
             self.results_tree.heading("count", text="个数")
 
+        try:
+            self.buffer_size = max(1, self.buffer_size_mb.get()) * 1024 * 1024
+        except tk.TclError:
+            self.buffer_size = DEFAULT_BUFFER_SIZE
+        try:
+            self.worker_count = max(1, self.worker_count_var.get())
+        except tk.TclError:
+            self.worker_count = 1
+        self.supported_exts = self.get_selected_filetypes()
+        self.run_cache = self.get_cache() if self.use_cache.get() else None
+        self.tabular = self.table_mode.get()
+        self.pairing = pairing
+
         self.status_var.set("正在提取数据...")
-        threading.Thread(target=self._extract_data_thread, args=(checked_files,), daemon=True).start()
+        if self.tail_mode.get():
+            self.tail_follower = TailFollower(self.queries, self.buffer_size, self.tabular, self.pairing)
+            self.tail_files = checked_files
+            self.tail_generation += 1
+            threading.Thread(target=self._tail_thread, args=(checked_files, self.tail_generation, False),
+                             daemon=True).start()
+        else:
+            self.tail_follower = None
+            self.tail_generation += 1
+            threading.Thread(target=self._extract_data_thread, args=(checked_files, self.tail_generation),
+                             daemon=True).start()
+
+    def _extract_data_thread(self, files_to_process, generation):
+        perf = self.perf
+        if perf is None:
+            self._extract_files(files_to_process, generation, None)
+            return
+        try:
+            with perf.capture(self.perf_profile, self.perf_profile):
+                self._extract_files(files_to_process, generation, perf)
+        finally:
+            perf.finish()
+            self.status_queue.put(("perf", None))
+
+    def _extract_files(self, files_to_process, generation, perf):
+        mode = self.result_mode
+        rows = []
+        last_flush = time.perf_counter()
+        last_chart = last_flush
+
+        def report_progress(done, total):
+            self.status_queue.put(("progress", done / total * 100))
+
+        for file_path, results, error in iter_extract(files_to_process, self.queries, self.buffer_size,
+                                                      self.worker_count, self.supported_exts,
+                                                      self.stop_extraction, report_progress, self.run_cache,
+                                                      self.tabular, perf, self.pairing):
+            file_name = os.path.basename(file_path)
+            if error is not None:
+                self.status_queue.put(("error", f"处理文件 {file_name} 时出错: {error}"))
+                continue
+            try:
+                rows.append(self._store_result(file_path, mode, results))
+            except Exception as e:
+                self.status_queue.put(("error", f"处理文件 {file_name} 时出错: {str(e)}"))
+            if len(rows) >= ROW_BATCH_MAX or time.perf_counter() - last_flush > ROW_FLUSH_INTERVAL:
+                self.status_queue.put(("rows", (generation, rows)))
+                rows = []
+                last_flush = time.perf_counter()
+            # 图表只用累计的直方图绘制，开销固定，提取过程中定时刷新
+            if time.perf_counter() - last_chart > CHART_REFRESH_INTERVAL:
+                self._generate_chart()
+                last_chart = time.perf_counter()
+
+        if rows:
+            self.status_queue.put(("rows", (generation, rows)))
+        if self.stop_extraction.is_set():
+            self.status_queue.put(("status", "提取已停止"))
+            return
 
-    def _extract_data_thread(self, files_to_process):
+        self._generate_chart()
+        self._update_status()
+
+    def _tail_tick(self, generation):
+        """定时增量提取，跟踪模式关闭、提取被停止或重新开始提取后不再继续"""
+        if (generation != self.tail_generation or not self.tail_mode.get() or self.stop_extraction.is_set()
+                or self.tail_follower is None):
+            return
+        threading.Thread(target=self._tail_thread, args=(self.tail_files, generation, True), daemon=True).start()
+
+    def _tail_thread(self, files_to_process, generation, quiet):
+        """跟踪模式：只提取文件新追加的内容并追加到结果中，定时运行时错误只显示在状态栏"""
+        perf = self.perf
+        with self.tail_lock:
+            with perf.capture(self.perf_profile, self.perf_profile) if perf is not None else contextlib.nullcontext():
+                self._tail_poll(files_to_process, generation, quiet)
+        if perf is not None:
+            perf.finish()
+            self.status_queue.put(("perf", None))
+        self.status_queue.put(("tail", generation))
+
+    def _tail_poll(self, files_to_process, generation, quiet):
+        mode = self.result_mode
+        follower = self.tail_follower
         total_files = len(files_to_process)
+        rows = []
         for i, file_path in enumerate(files_to_process):
             if self.stop_extraction.is_set():
                 self.status_queue.put(("status", "提取已停止"))
+                break
+            if generation != self.tail_generation:
                 return
 
+            file_name = os.path.basename(file_path)
             try:
-                file_name = os.path.basename(file_path)
-                content = self.read_file_content(file_path)
-
-                if self.extract_mode.get() == 1:
-                    values = self._extract_single_values(content, self.search_text1)
-                    self.extracted_single[file_name] = values
-                    count = len(values) if values else 0
-                    display = ', '.join(map(lambda x: f"{x:.4f}", values)) if values else "未找到"
-                    self.results_tree.insert("", tk.END, text=file_name, values=(display, count))
-                elif self.extract_mode.get() == 2:
-                    values = self._extract_double_values(content, self.search_text1)
-                    self.extracted_double[file_name] = values
-                    count = len(values) if values else 0
-                    if values:
-                        self.results_tree.insert("", tk.END, text=file_name,
-                                                 values=(f"{values[0][0]:.4f}", f"{values[0][1]:.4f}", count))
-                    else:
-                        self.results_tree.insert("", tk.END, text=file_name, values=("未找到", "未找到", 0))
-                elif self.extract_mode.get() == 3:
-                    values = self._extract_dual_values(content)
-                    self.extracted_dual[file_name] = values
-                    count = len(values) if values else 0
-                    if values:
-                        self.results_tree.insert("", tk.END, text=file_name,
-                                                 values=(f"{values[0][0]:.4f}", f"{values[0][1]:.4f}", count))
-                    else:
-                        self.results_tree.insert("", tk.END, text=file_name, values=("未找到", "未找到", 0))
-                else:
-                    values = self._extract_triple_values(content, self.search_text1)
-                    self.extracted_triple[file_name] = values
-                    count = len(values) if values else 0
-                    if values:
-                        self.results_tree.insert("", tk.END, text=file_name,
-                                                 values=(
-                                                     f"{values[0][0]:.4f}", f"{values[0][1]:.4f}",
-                                                     f"{values[0][2]:.4f}",
-                                                     count))
-                    else:
-                        self.results_tree.insert("", tk.END, text=file_name, values=("未找到", "未找到", "未找到", 0))
-
-                progress = (i + 1) / total_files * 100
-                self.status_queue.put(("progress", progress))
+                file_ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+                if file_ext not in self.supported_exts:
+                    raise ValueError(f"不支持的文件类型: {file_ext}")
+                start = time.perf_counter()
+                results, reset = follower.poll(file_path)
+                if self.perf is not None:
+                    self.perf.add_file(file_path, time.perf_counter() - start, None)
+                if reset or file_path not in self.results or any(len(v) for v in results):
+                    rows.append(self._store_result(file_path, mode, results, append=not reset))
             except Exception as e:
-                self.status_queue.put(("error", f"处理文件 {file_name} 时出错: {str(e)}"))
-
-            time.sleep(0.01)
-
-        self._generate_chart()
-        self._update_status()
+                self.status_queue.put(("status" if quiet else "error", f"处理文件 {file_name} 时出错: {str(e)}"))
+            self.status_queue.put(("progress", (i + 1) / total_files * 100))
+
+        if rows:
+            self.status_queue.put(("rows", (generation, rows)))
+            if not self.stop_extraction.is_set():
+                self._generate_chart()
+                self._update_status()
+
+    def _store_result(self, file_path, mode, results, append=False):
+        """保存单个文件的提取结果，append 为 True 时追加到已有结果后
+
+        返回 (文件路径, 显示内容)，由后台线程成批发送给主线程写入结果列表。
+        显示内容只由本次保存的结果和该文件的记录数得出，不调用 results.get()：乱序追加后 get() 会重新排序全部数值，
+        跟踪模式下每个文件每轮都会触发。
+        """
+        start = time.perf_counter()
+        self.results.add(file_path, results, append=append)
+        counts = self.results.counts(file_path)
+        if self.perf is not None:
+            self.perf.add('store', time.perf_counter() - start)
+        cells = self._result_cells(mode, results, self.result_cells.get(file_path) if append else None)
+        self.result_cells[file_path] = cells
+        return file_path, self._result_row(mode, cells, counts)
+
+    def _result_cells(self, mode, results, previous=None):
+        """每个查询的显示值：单个单值查询为全部数值组成的文本，其余为第一条记录各值的文本，没有记录时为 None
+
+        previous 为追加之前的显示值，追加的数值接在其后（第一条记录不变）。
+        """
+        cells = []
+        for n, values in enumerate(results):
+            values = np.asarray(values)
+            cell = previous[n] if previous is not None else None
+            if len(values) == 0:
+                pass
+            elif mode != 5 and values.ndim == 1:
+                text = ', '.join(map(lambda x: f"{x:.4f}", values))
+                cell = f"{cell}, {text}" if cell else text
+            elif cell is None:
+                cell = tuple(f"{v:.4f}" for v in np.atleast_1d(values[0]))
+            cells.append(cell)
+        return cells
+
+    def _result_row(self, mode, cells, counts):
+        """结果列表中一个文件的显示内容，cells 见 _result_cells，counts 为每个查询的记录数"""
+        if mode == 5:
+            return (tuple(", ".join(cell) if cell else "未找到" for cell in cells)
+                    + ("/".join(map(str, counts)),))
+
+        # 单个查询：每条记录一个值时列出全部数值，多个值时显示第一条记录
+        cell, count = cells[0], counts[0]
+        if isinstance(cell, str):
+            return cell, count
+        if cell:
+            return cell + (count,)
+        return ("未找到",) * query_columns(self.results.queries[0]) + (0,)
 
     def _update_status(self):
-        mode = self.extract_mode.get()
-        if mode == 1:
-            valid_files = sum(1 for v in self.extracted_single.values() if v)
-            self.status_queue.put(
-                ("status", f"完成单文本单值提取，处理 {len(self.extracted_single)} 个文件，成功 {valid_files} 个"))
-        elif mode == 2:
-            valid_files = sum(1 for v in self.extracted_double.values() if v)
-            self.status_queue.put(
-                ("status", f"完成单文本双值提取，处理 {len(self.extracted_double)} 个文件，成功 {valid_files} 个"))
-        elif mode == 3:
-            valid_files = sum(1 for v in self.extracted_dual.values() if v)
-            self.status_queue.put(
-                ("status", f"完成双文本关联值提取，处理 {len(self.extracted_dual)} 个文件，成功 {valid_files} 个"))
-        else:
-            valid_files = sum(1 for v in self.extracted_triple.values() if v)
-            self.status_queue.put(
-                ("status", f"完成单文本三值提取，处理 {len(self.extracted_triple)} 个文件，成功 {valid_files} 个"))
-
-    def read_file_content(self, file_path):
-        file_ext = os.path.splitext(file_path)[1].lower().lstrip('.')
-
-        supported_exts = self.get_selected_filetypes()
-        if file_ext not in supported_exts:
-            raise ValueError(f"不支持的文件类型: {file_ext}")
+        mode = self.result_mode
+        valid_files = np.count_nonzero(self.results.file_counts())
+        self.status_queue.put(
+            ("status", f"完成{MODE_NAMES[mode]}，处理 {len(self.results)} 个文件，成功 {valid_files} 个"))
+
+    def _draw_histogram(self, ax, histogram, **kwargs):
+        """按结果集中累计的定宽直方图画阶梯图，绘制开销与数值个数无关"""
+        binned = histogram.binned(CHART_BINS)
+        if binned is not None:
+            counts, (edges,) = binned
+            ax.stairs(counts, edges, fill=True, **kwargs)
 
-        if file_ext in ('dat', 'txt', 'log'):
-            try:
-                # 尝试多种编码格式
-                encodings = ['utf-8', 'gbk', 'latin-1', 'cp1252', 'iso-8859-1']
-                for encoding in encodings:
-                    try:
-                        with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
-                            return f.read()
-                    except UnicodeDecodeError:
-                        continue
-                # 如果所有编码都失败，使用二进制模式读取
-                with open(file_path, 'rb') as f:
-                    return f.read().decode('utf-8', errors='ignore')
-            except Exception as e:
-                raise ValueError(f"读取文件失败: {str(e)}")
-        elif file_ext == 'xlsx':
-            try:
-                df = pd.read_excel(file_path, engine='openpyxl', dtype=str, nrows=1000)
-                return '\n'.join(df.astype(str).values.flatten())
-            except Exception as e:
-                raise ValueError(f"读取Excel文件失败: {str(e)}")
-        else:
+    def _generate_chart(self):
+        """请求重新绘制图表，可在任意线程调用；渲染线程忙时多次请求合并为一次"""
+        self.chart_requested.set()
+
+    def on_chart_resize(self, event):
+        """图表区域大小改变时按新的像素大小重新绘制"""
+        if event.width > 1 and event.height > 1 and (event.width, event.height) != self.chart_size:
+            self.chart_size = (event.width, event.height)
+            if self.result_mode is not None:
+                self._generate_chart()
+
+    def _chart_render_loop(self):
+        """图表渲染线程：在后台用 Agg 把图表绘制为位图（PPM），再通过 status_queue 交给主线程显示"""
+        canvas = FigureCanvasAgg(self.figure)
+        while True:
+            self.chart_requested.wait()
+            self.chart_requested.clear()
             try:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    return f.read()
+                start = time.perf_counter()
+                width, height = self.chart_size
+                self.figure.set_size_inches(width / CHART_DPI, height / CHART_DPI)
+                # 只在组织图表时持有结果集的锁，耗时的 Agg 绘制不阻塞提取线程
+                results = self.results
+                with results.lock:
+                    drawn = self._draw_chart(results)
+                if not drawn:
+                    continue
+                canvas.draw()
+                rgba = np.asarray(canvas.buffer_rgba())
+                header = f"P6\n{rgba.shape[1]} {rgba.shape[0]}\n255\n".encode()
+                data = header + rgba[:, :, :3].tobytes()
+                self.status_queue.put(("chart", (rgba.shape[1], rgba.shape[0], data)))
+                if self.perf is not None:
+                    self.perf.add('chart', time.perf_counter() - start, len(data))
             except Exception as e:
-                raise ValueError(f"读取{file_ext}文件失败: {str(e)}")
-
-    # 改进的提取方法 - 处理关键词后无空格的情况
-    def _extract_single_values(self, content, keyword):
-        # 改进模式：关键词后跟0个或多个空白，然后是一个数字
-        pattern = re.compile(
-            f"{re.escape(keyword)}[\\s\\t]*(-?\\d+(?:\\.\\d+)?(?:[eE][-+]?\\d+)?)"
-        )
-
-        values = []
-        for match in pattern.finditer(content):
-            try:
-                values.append(float(match.group(1)))
-            except ValueError:
-                continue
-        return values
-
-    def _extract_double_values(self, content, keyword):
-        # 匹配关键词后跟两个数值
-        pattern = re.compile(
-            f"{re.escape(keyword)}[\\s\\t]*(-?\\d+(?:\\.\\d+)?(?:[eE][-+]?\\d+)?)[\\s\\t\\S]+?(-?\\d+(?:\\.\\d+)?(?:[eE][-+]?\\d+)?)"
-        )
+                self.status_queue.put(("status", f"生成图表时出错: {str(e)}"))
 
-        values = []
-        for match in pattern.finditer(content):
-            try:
-                values.append((float(match.group(1)), float(match.group(2))))
-            except ValueError:
-                continue
-        return values
-
-    def _extract_dual_values(self, content):
-        # 匹配两个不同的关键词及其数值
-        pattern = re.compile(
-            fr'{re.escape(self.search_text1)}[\s\t]*(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?).*?'
-            fr'{re.escape(self.search_text2)}[\s\t]*(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)',
-            re.DOTALL
-        )
-
-        values = []
-        for match in pattern.finditer(content):
-            try:
-                values.append((float(match.group(1)), float(match.group(2))))
-            except ValueError:
-                continue
-        return values
-
-    def _extract_triple_values(self, content, keyword):
-        # 匹配关键词后跟三个数值
-        pattern = re.compile(
-            f"{re.escape(keyword)}[\\s\\t]*(-?\\d+(?:\\.\\d+)?(?:[eE][-+]?\\d+)?)[\\s\\t\\S]+?"
-            f"(-?\\d+(?:\\.\\d+)?(?:[eE][-+]?\\d+)?)[\\s\\t\\S]+?(-?\\d+(?:\\.\\d+)?(?:[eE][-+]?\\d+)?)"
-        )
+    def _draw_chart(self, results):
+        """根据结果集的流式统计绘图：直方图使用累计的定宽直方图，关联值较多时用二维密度图代替散点图
 
-        values = []
-        for match in pattern.finditer(content):
-            try:
-                values.append((float(match.group(1)), float(match.group(2)), float(match.group(3))))
-            except ValueError:
-                continue
-        return values
-
-    def _generate_chart(self):
+        只在渲染线程中持有 results.lock 时调用，绘制期间提取线程不会修改数据；没有可绘制的数据时返回 False。
+        """
         self.figure.clear()
-        mode = self.extract_mode.get()
-
-        if mode == 1:
-            valid_data = {k: v for k, v in self.extracted_single.items() if v}
-            if not valid_data:
-                self.status_queue.put(("status", "没有可用于生成图表的单数值数据"))
-                return
-
-            all_values = [val for sublist in valid_data.values() for val in sublist]
-            ax = self.figure.add_subplot(111)
-            ax.hist(all_values, bins=20)
-            ax.set_title(f"{self.search_text1} 后单数值分布")
-            ax.set_xlabel("数值")
-            ax.set_ylabel("频率")
-        elif mode == 2:
-            valid_data = {k: v for k, v in self.extracted_double.items() if v}
-            if not valid_data:
-                self.status_queue.put(("status", "没有可用于生成图表的双数值数据"))
-                return
-
-            values1 = [v[0] for sublist in valid_data.values() for v in sublist]
-            values2 = [v[1] for sublist in valid_data.values() for v in sublist]
-
-            ax1 = self.figure.add_subplot(211)
-            ax1.hist(values1, bins=20, color='blue', alpha=0.7, label='第一个值')
-            ax1.set_title(f"{self.search_text1} 后双数值分布")
-            ax1.set_ylabel("频率")
-            ax1.legend()
-
-            ax2 = self.figure.add_subplot(212)
-            ax2.hist(values2, bins=20, color='green', alpha=0.7, label='第二个值')
-            ax2.set_xlabel("数值")
-            ax2.set_ylabel("频率")
-            ax2.legend()
-
-            self.figure.tight_layout()
-        elif mode == 3:
-            valid_data = {k: v for k, v in self.extracted_dual.items() if v}
-            if not valid_data:
-                self.status_queue.put(("status", "没有可用于生成图表的双文本关联值数据"))
-                return
-
-            all_pairs = [pair for pairs in valid_data.values() for pair in pairs]
-            values1 = [pair[0] for pair in all_pairs]
-            values2 = [pair[1] for pair in all_pairs]
-
-            ax = self.figure.add_subplot(111)
-            ax.scatter(values1, values2, alpha=0.7)
-            ax.set_title(f"{self.search_text1} 与 {self.search_text2} 关联关系")
-            ax.set_xlabel(self.search_text1)
-            ax.set_ylabel(self.search_text2)
-            ax.grid(True, linestyle='--', alpha=0.7)
-
-            if len(values1) > 1:
-                corr = np.corrcoef(values1, values2)[0, 1]
-                ax.text(0.05, 0.95, f"相关系数: {corr:.4f}", transform=ax.transAxes,
-                        verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
+        mode = self.result_mode
+
+        if mode != 5:
+            template = query_template(results.queries[0])
+            summary = results.summary(0)
+            if summary.count == 0:
+                self.status_queue.put(("status", f"没有可用于生成图表的{MODE_NAMES[mode]}数据"))
+                return False
+
+            if template.paired:
+                # 两个值分别跟在不同关键词之后：画两者的关联关系
+                ax = self.figure.add_subplot(111)
+                if summary.count <= CHART_SCATTER_MAX:
+                    all_pairs = results.values(0).copy()
+                    ax.scatter(all_pairs[:, 0], all_pairs[:, 1], alpha=0.7)
+                else:
+                    # 点数很多时散点图绘制极慢，改为按累计的二维直方图画密度图（对数色标）
+                    counts, (x_edges, y_edges) = summary.density.binned()
+                    mesh = ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts.T, 0), norm=LogNorm())
+                    self.figure.colorbar(mesh, ax=ax, label="点数")
+                ax.set_title(f"{template.keys[0]} 与 {template.keys[1]} 关联关系")
+                ax.set_xlabel(template.keys[0])
+                ax.set_ylabel(template.keys[1])
+                ax.grid(True, linestyle='--', alpha=0.7)
+
+                if summary.count > 1:
+                    ax.text(0.05, 0.95, f"相关系数: {summary.corr():.4f}", transform=ax.transAxes,
+                            verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
+            else:
+                # 每个值一个子图，最多显示 CHART_MAX_PLOTS 个
+                shown = template.labels[:CHART_MAX_PLOTS]
+                colors = ['blue', 'green', 'red', 'purple', 'orange', 'brown']
+                for j, label in enumerate(shown):
+                    ax = self.figure.add_subplot(len(shown), 1, j + 1)
+                    self._draw_histogram(ax, summary.histograms[j], color=colors[j], alpha=0.7, label=label)
+                    ax.set_ylabel("频率")
+                    ax.legend()
+                    if j == 0:
+                        ax.set_title(f"{template.text} 数值分布")
+                ax.set_xlabel("数值")
         else:
-            valid_data = {k: v for k, v in self.extracted_triple.items() if v}
-            if not valid_data:
-                self.status_queue.put(("status", "没有可用于生成图表的三数值数据"))
-                return
-
-            all_triples = [triple for triples in valid_data.values() for triple in triples]
-            values1 = [triple[0] for triple in all_triples]
-            values2 = [triple[1] for triple in all_triples]
-            values3 = [triple[2] for triple in all_triples]
-
-            # ax1 = self.figure.add_subplot(311)
-            # ax1.hist(values1, bins=20, color='blue', alpha=0.7, label='第一个值')
-            # ax1.set_title(f"{self.search_text1} 后三数值分布")
-            # ax1.set_ylabel("频率")
-            # ax1.legend()
-
-            # ax2 = self.figure.add_subplot(312)
-            # ax2.hist(values2, bins=20, color='green', alpha=0.7, label='第二个值')
-            # ax2.set_ylabel("频率")
-            # ax2.legend()
-
-            ax3 = self.figure.add_subplot(111)
-            ax3.hist(values3, bins=20, color='red', alpha=0.7, label='值')
-            ax3.set_xlabel("数值")
-            ax3.set_ylabel("频率")
-            ax3.legend()
-
-            self.figure.tight_layout()
+            # 每个关键词一个子图，显示第一个值的分布，最多显示 CHART_MAX_PLOTS 个
+            shown = [(i, q) for i, q in enumerate(results.queries)
+                     if results.summary(i).count][:CHART_MAX_PLOTS]
+            if not shown:
+                self.status_queue.put(("status", "没有可用于生成图表的多关键词数据"))
+                return False
+
+            for n, (i, query) in enumerate(shown, 1):
+                ax = self.figure.add_subplot(len(shown), 1, n)
+                self._draw_histogram(ax, results.summary(i).histograms[0], alpha=0.7)
+                ax.set_ylabel(query_label(query))
 
         self.figure.tight_layout()
-        self.status_queue.put(("chart", "图表已更新"))
+        return True
 
     def export_to_excel(self):
         mode = self.extract_mode.get()
 
-        if mode == 1 and not self.extracted_single:
-            messagebox.showwarning("警告", "没有提取的单数值数据可导出")
-            return
-        if mode == 2 and not self.extracted_double:
-            messagebox.showwarning("警告", "没有提取的双数值数据可导出")
+        if self.export_thread is not None and self.export_thread.is_alive():
+            messagebox.showwarning("警告", "正在导出，请等待完成或取消导出")
             return
-        if mode == 3 and not self.extracted_dual:
-            messagebox.showwarning("警告", "没有提取的双文本关联值数据可导出")
-            return
-        if mode == 4 and not self.extracted_triple:
-            messagebox.showwarning("警告", "没有提取的三数值数据可导出")
+
+        if self.result_mode != mode or len(self.results) == 0:
+            messagebox.showwarning("警告", f"没有{MODE_NAMES[mode]}的数据可导出")
             return
 
-        checked_files = [os.path.basename(path) for path in self.get_checked_files()]
+        checked_files = self.get_checked_files()
         if not checked_files:
             messagebox.showwarning("警告", "请至少选择一个文件")
             return
 
         file_path = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
-            filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")]
+            filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"), ("Parquet files", "*.parquet"),
+                       ("Feather files", "*.feather")]
         )
         if not file_path:
             return
 
-        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-            if mode == 1:
-                filtered_data = {k: v for k, v in self.extracted_single.items() if k in checked_files}
-                self._export_single_excel(writer, filtered_data)
-            elif mode == 2:
-                filtered_data = {k: v for k, v in self.extracted_double.items() if k in checked_files}
-                self._export_double_excel(writer, filtered_data)
-            elif mode == 3:
-                filtered_data = {k: v for k, v in self.extracted_dual.items() if k in checked_files}
-                self._export_dual_excel(writer, filtered_data)
-            else:
-                filtered_data = {k: v for k, v in self.extracted_triple.items() if k in checked_files}
-                self._export_triple_excel(writer, filtered_data)
-
-            if self.process_data.get():
-                self._export_statistics(writer, checked_files)
-
-        messagebox.showinfo("成功", f"数据已成功导出到 {file_path}")
-        self.status_var.set(f"数据已导出到 {file_path}")
-
-    def _export_single_excel(self, writer, data_dict):
-        data = []
-        for file_name, values in data_dict.items():
-            base_name = os.path.splitext(file_name)[0]
-            count = len(values) if values else 0
-
-            if not values:
-                data.append({
-                    '角度': base_name,
-                    '值的个数': count,
-                    '序号': 1,
-                    f'{self.search_text1}值': '未找到'
-                })
-                continue
-
-            for idx, val in enumerate(values, 1):
-                data.append({
-                    '角度': base_name,
-                    '个数': idx,
-                    f'{self.search_text1}值': val
-                })
-
-        pd.DataFrame(data).to_excel(writer, sheet_name='数据预览', index=False)
-
-    def _export_double_excel(self, writer, data_dict):
-        data = []
-        for file_name, values in data_dict.items():
-            base_name = os.path.splitext(file_name)[0]
-            count = len(values) if values else 0
-
-            if not values:
-                data.append({
-                    '文件名': base_name,
-                    '值的组数': count,
-                    '序号': 1,
-                    f'{self.search_text1}值1': '未找到',
-                    f'{self.search_text1}值2': '未找到'
-                })
-                continue
-
-            for idx, (val1, val2) in enumerate(values, 1):
-                data.append({
-                    '角度': base_name,
-                    '个数': idx,
-                    f'{self.search_text1}值1': val1,
-                    f'{self.search_text1}值2': val2
-                })
-
-        pd.DataFrame(data).to_excel(writer, sheet_name='数值数据', index=False)
-
-    def _export_dual_excel(self, writer, data_dict):
-        data = []
-        for file_name, values in data_dict.items():
-            base_name = os.path.splitext(file_name)[0]
-            count = len(values) if values else 0
-
-            if not values:
-                data.append({
-                    '文件名': base_name,
-                    '匹配行数': count,
-                    '序号': 1,
-                    f'{self.search_text1}值': '未找到',
-                    f'{self.search_text2}值': '未找到'
-                })
-                continue
-
-            for idx, (val1, val2) in enumerate(values, 1):
-                data.append({
-                    '角度': base_name,
-                    '个数': count,
-                    '序号': idx,
-                    f'{self.search_text1}值': val1,
-                    f'{self.search_text2}值': val2
-                })
-
-        pd.DataFrame(data).to_excel(writer, sheet_name='数据预览', index=False)
-
-    def _export_triple_excel(self, writer, data_dict):
-        data = []
-        for file_name, values in data_dict.items():
-            count = len(values) if values else 0
-
-            if not values:
-                data.append({
-                    '文件名': file_name,
-                    '值的组数': count,
-                    '序号': 1,
-                    f'{self.search_text1}值1': '未找到',
-                    f'{self.search_text1}值2': '未找到',
-                    f'{self.search_text1}值3': '未找到'
-                })
-                continue
-
-            for idx, (val1, val2, val3) in enumerate(values, 1):
-                data.append({
-                    '角度': file_name,
-                    '序号': idx,
-                    # f'{self.search_text1}值1': val1,
-                    # f'{self.search_text1}值2': val2,
-                    f'{self.search_text1}值3': val3
-                })
-
-        pd.DataFrame(data).to_excel(writer, sheet_name='数值数据', index=False)
-
-    def _export_statistics(self, writer, file_names):
-        mode = self.extract_mode.get()
-        if mode == 1:
-            filtered_data = {k: v for k, v in self.extracted_single.items() if k in file_names}
-            self._export_single_statistics(writer, filtered_data)
-        elif mode == 2:
-            filtered_data = {k: v for k, v in self.extracted_double.items() if k in file_names}
-            self._export_double_statistics(writer, filtered_data)
-        elif mode == 3:
-            filtered_data = {k: v for k, v in self.extracted_dual.items() if k in file_names}
-            self._export_dual_statistics(writer, filtered_data)
-        else:
-            filtered_data = {k: v for k, v in self.extracted_triple.items() if k in file_names}
-            self._export_triple_statistics(writer, filtered_data)
-
-    def _export_single_statistics(self, writer, data_dict):
-        stats = []
-        for file_name, values in data_dict.items():
-            base_name = os.path.splitext(file_name)[0]
-            if not values:
-                stats.append({
-                    '文件名': base_name,
-                    '值的个数': 0,
-                    '最小值': 'N/A',
-                    '最大值': 'N/A',
-                    '平均值': 'N/A',
-                    '标准差': 'N/A'
-                })
-                continue
-
-            stats.append({
-                '角度': base_name,
-                '个数': len(values),
-                '最小值': min(values),
-                '最大值': max(values),
-                '差值': max(values) - min(values),
-                '平均值': np.mean(values),
-                '标准差': np.std(values) if len(values) > 1 else 0
-            })
-
-        pd.DataFrame(stats).to_excel(writer, sheet_name='数据处理', index=False)
-
-    def _export_double_statistics(self, writer, data_dict):
-        stats = []
-        for file_name, values in data_dict.items():
-            base_name = os.path.splitext(file_name)[0]
-            if not values:
-                stats.append({
-                    '文件名': base_name,
-                    '值的组数': 0,
-                    '值1最小值': 'N/A', '值1最大值': 'N/A', '值1平均值': 'N/A', '值1标准差': 'N/A',
-                    '值2最小值': 'N/A', '值2最大值': 'N/A', '值2平均值': 'N/A', '值2标准差': 'N/A'
-                })
-                continue
-
-            vals1 = [v[0] for v in values]
-            vals2 = [v[1] for v in values]
-
-            stats.append({
-                '角度': base_name,
-                '个数': len(values),
-                '值1最小值': min(vals1), '值1最大值': max(vals1), '值1平均值': np.mean(vals1),
-                '值1标准差': np.std(vals1) if len(vals1) > 1 else 0,
-                '值2最小值': min(vals2), '值2最大值': max(vals2), '值2平均值': np.mean(vals2),
-                '值2标准差': np.std(vals2) if len(vals2) > 1 else 0
-            })
-
-        pd.DataFrame(stats).to_excel(writer, sheet_name='双数值统计', index=False)
-
-    def _export_dual_statistics(self, writer, data_dict):
-        stats = []
-        for file_name, values in data_dict.items():
-            base_name = os.path.splitext(file_name)[0]
-            if not values:
-                stats.append({
-                    '文件名': base_name,
-                    '个数': 0,
-                    f'{self.search_text1}最小值': 'N/A', f'{self.search_text1}最大值': 'N/A',
-                    f'{self.search_text1}平均值': 'N/A', f'{self.search_text1}标准差': 'N/A',
-                    f'{self.search_text2}最小值': 'N/A', f'{self.search_text2}最大值': 'N/A',
-                    f'{self.search_text2}平均值': 'N/A', f'{self.search_text2}标准差': 'N/A',
-                })
-                continue
-
-            vals1 = [v[0] for v in values]
-            vals2 = [v[1] for v in values]
-
-            corr = np.corrcoef(vals1, vals2)[0, 1] if len(vals1) > 1 else 'N/A'
-
-            stats.append({
-                '角度': base_name,
-                '个数': len(values),
-                f'{self.search_text1}最小值': min(vals1), f'{self.search_text1}最大值': max(vals1),
-                f'{self.search_text1}平均值': np.mean(vals1),
-                f'{self.search_text1}标准差': np.std(vals1) if len(vals1) > 1 else 0,
-                f'{self.search_text2}最小值': min(vals2), f'{self.search_text2}最大值': max(vals2),
-                f'{self.search_text2}平均值': np.mean(vals2),
-                f'{self.search_text2}标准差': np.std(vals2) if len(vals2) > 1 else 0,
-            })
-
-        pd.DataFrame(stats).to_excel(writer, sheet_name='数据统计', index=False)
-
-    def _export_triple_statistics(self, writer, data_dict):
-        stats = []
-        for file_name, values in data_dict.items():
-            base_name = os.path.splitext(file_name)[0]
-            if not values:
-                stats.append({
-                    '文件名': base_name,
-                    '个数': 0,
-                    f'{self.search_text1}值1最小值': 'N/A', f'{self.search_text1}值1最大值': 'N/A',
-                    f'{self.search_text1}值1平均值': 'N/A', f'{self.search_text1}值1标准差': 'N/A',
-                    f'{self.search_text1}值2最小值': 'N/A', f'{self.search_text1}值2最大值': 'N/A',
-                    f'{self.search_text1}值2平均值': 'N/A', f'{self.search_text1}值2标准差': 'N/A',
-                    f'{self.search_text1}值3最小值': 'N/A', f'{self.search_text1}值3最大值': 'N/A',
-                    f'{self.search_text1}值3平均值': 'N/A', f'{self.search_text1}值3标准差': 'N/A'
-                })
-                continue
-
-            vals1 = [v[0] for v in values]
-            vals2 = [v[1] for v in values]
-            vals3 = [v[2] for v in values]
-
-            stats.append({
-                '角度': base_name,
-                '个数': len(values),
-                # f'值1最小值': min(vals1), f'值1最大值': max(vals1),
-                # f'值1平均值': np.mean(vals1),
-                # f'值1标准差': np.std(vals1) if len(vals1) > 1 else 0,
-                # f'值2最小值': min(vals2), f'值2最大值': max(vals2),
-                # f'值2平均值': np.mean(vals2),
-                # f'值2标准差': np.std(vals2) if len(vals2) > 1 else 0,
-                f'值3最小值': min(vals3), f'值3最大值': max(vals3),
-                f'值3平均值': np.mean(vals3),
-                f'值3标准差': np.std(vals3) if len(vals3) > 1 else 0
-            })
+        self.stop_export.clear()
+        self.status_var.set("正在导出数据...")
+        # 表头和查询取自被导出的结果集本身：提取中途放弃时 self.queries 可能已是新的关键词
+        store = self.results.select(checked_files)
+        self.export_thread = threading.Thread(
+            target=self._export_thread,
+            args=(file_path, mode, store, store.queries, self.process_data.get()),
+            daemon=True)
+        self.export_thread.start()
+
+    def _export_thread(self, file_path, mode, store, queries, statistics):
+        """后台导出，进度和结果通过 status_queue 通知主线程"""
+        def report_progress(done, total):
+            self.status_queue.put(("progress", done / total * 100 if total else 100))
+
+        perf = self.perf
+        start = time.perf_counter()
+        try:
+            export_results(file_path, mode, store, queries, statistics=statistics, progress=report_progress,
+                           stop_event=self.stop_export)
+            if perf is not None:
+                size = os.path.getsize(file_path) if os.path.isfile(file_path) else 0
+                perf.add('export', time.perf_counter() - start, size)
+                perf.finish()
+                self.status_queue.put(("perf", None))
+        except ExportCancelled:
+            self.status_queue.put(("status", "导出已取消"))
+            return
+        except Exception as e:
+            self.status_queue.put(("error", f"导出到 {file_path} 时出错: {str(e)}"))
+            return
+        self.status_queue.put(("export", file_path))
 
-        pd.DataFrame(stats).to_excel(writer, sheet_name='数值统计', index=False)
+    def cancel_export(self):
+        if self.export_thread is None or not self.export_thread.is_alive():
+            return
+        self.stop_export.set()
+        self.status_var.set("正在取消导出...")
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = DatFileExtractor(root)
     root.mainloop()
\ No newline at end of file